@@ -0,0 +1,403 @@
+import argparse
+import os
+import sys
+
+
+def add_model_arguments(parser):
+    parser.add_argument('--model', default='models/face_swapper_model.onnx', help="Ruta al modelo ONNX de face swapper")
+    parser.add_argument('--det-size', type=int, default=640, help="Tamaño de entrada del detector (cuadrado)")
+    parser.add_argument('--det-sizes', help="Tamaños de detector adicionales separados por comas (p. ej. 320,1024); "
+                                            "cada imagen usa el menor que cubre su lado mayor")
+    parser.add_argument('--providers', help="Proveedores de ONNX Runtime separados por comas (p. ej. CPUExecutionProvider)")
+    parser.add_argument('--opt-level', default='all', choices=['disable', 'basic', 'extended', 'all'],
+                        help="Nivel de optimización del grafo")
+    parser.add_argument('--optimized-cache', help="Directorio donde guardar los grafos optimizados entre arranques")
+    parser.add_argument('--int8', help="Variante INT8 del swapper generada con 'cli.py quantize'")
+
+
+def add_output_arguments(parser):
+    parser.add_argument('--format', choices=['png', 'jpg', 'webp', 'bmp'], help="Formato de salida (por defecto PNG)")
+    parser.add_argument('--quality', type=int, help="Calidad JPEG/WebP (1-100)")
+    parser.add_argument('--png-compression', type=int, choices=range(10), metavar='0-9',
+                        help="Nivel de compresión PNG (0 = sin comprimir, 9 = máximo)")
+    parser.add_argument('--writers', type=int, default=1,
+                        help="Hilos de codificación y escritura por worker (0 = en el mismo hilo del swap)")
+
+
+def add_result_cache_arguments(parser):
+    parser.add_argument('--result-cache', help="Directorio de la caché de resultados (repetir un swap no lo recalcula)")
+    parser.add_argument('--result-cache-mb', type=int, default=1024, help="Tamaño máximo de la caché de resultados")
+
+
+def result_cache_options(args):
+    if not args.result_cache:
+        return None
+    return {'cache_dir': args.result_cache, 'max_bytes': args.result_cache_mb * 2 ** 20}
+
+
+def output_options(args):
+    return {'workers': args.writers, 'fmt': args.format, 'quality': args.quality,
+            'png_compression': args.png_compression}
+
+
+def swapper_kwargs(args):
+    from core.runtime import SessionConfig
+    threads = getattr(args, 'threads', None)
+    config = SessionConfig(providers=args.providers.split(',') if args.providers else None,
+                           intra_op_threads=threads, inter_op_threads=1 if threads else None,
+                           optimization_level=args.opt_level, optimized_cache_dir=args.optimized_cache)
+    det_sizes = [(int(n), int(n)) for n in args.det_sizes.split(',')] if args.det_sizes else None
+    return {'model_path': args.model, 'det_size': (args.det_size, args.det_size), 'det_sizes': det_sizes,
+            'session_config': config, 'quantized_model_path': args.int8}
+
+
+def cmd_batch(args):
+    from core.batch import collect_targets, run_batch, write_report
+    targets = collect_targets(args.targets)
+    if not targets:
+        print(f"No se encontraron imágenes en {args.targets}", file=sys.stderr)
+        return 1
+    report = run_batch(args.source, targets, args.output_dir, workers=args.workers,
+                       threads_per_worker=args.threads, swapper_kwargs=swapper_kwargs(args),
+                       output_options=output_options(args), result_cache_options=result_cache_options(args))
+    if args.report:
+        write_report(report, args.report)
+    s = report['summary']
+    print(f"{s['ok']}/{s['total']} correctas ({s['cached']} desde caché) en {s['wall_seconds']:.1f}s "
+          f"({s['images_per_second']:.2f} img/s)")
+    return 0 if s['failed'] == 0 else 2
+
+
+def cmd_watch(args):
+    import logging
+    import signal
+    from core.hot_folder import HotFolder
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s', stream=sys.stderr)
+    hot_folder = HotFolder(args.source, args.input_dir, args.output_dir, queue_path=args.queue, workers=args.workers,
+                           threads_per_worker=args.threads, swapper_kwargs=swapper_kwargs(args),
+                           output_options=output_options(args), result_cache_options=result_cache_options(args),
+                           settle_seconds=args.settle, poll_interval=args.poll, metrics_path=args.metrics)
+    # SIGTERM para como Ctrl+C: los trabajos sin terminar se retoman en el siguiente arranque
+    signal.signal(signal.SIGTERM, lambda *_: hot_folder.stop.set())
+    print(f"Vigilando {args.input_dir} -> {args.output_dir}", file=sys.stderr)
+    try:
+        metrics = hot_folder.run(once=args.once)
+    except KeyboardInterrupt:
+        return 130
+    print(f"{metrics['done']} correctas, {metrics['failed']} fallidas, {metrics['pending']} pendientes",
+          file=sys.stderr)
+    return 0 if metrics['failed'] == 0 else 2
+
+
+def cmd_video(args):
+    import json
+    if args.processes or args.scaling:
+        return cmd_video_multiprocess(args)
+    from core.face_cache import FaceCache
+    from core.face_swapper import FaceSwapper
+    from core.tracker import FaceTracker
+    from core.video import process_video
+    swapper = FaceSwapper(face_cache=FaceCache(), **swapper_kwargs(args))
+    tracker = None
+    if args.keyframe_interval > 1:
+        tracker = FaceTracker(swapper, keyframe_interval=args.keyframe_interval, max_drift=args.max_drift)
+
+    def progress(done, total):
+        if done % 25 == 0:
+            print(f"{done}/{total or '?'} frames", file=sys.stderr)
+
+    stats = process_video(swapper, args.source, args.video, args.output, queue_size=args.queue_size,
+                          progress=progress, tracker=tracker, batch_frames=args.batch_frames)
+    print(json.dumps(stats, indent=2))
+    return 0
+
+
+def cmd_video_multiprocess(args):
+    import json
+    from core.shared_frames import process_video_multiprocess, scaling_report
+    if args.keyframe_interval > 1:
+        print("--keyframe-interval se ignora con --processes: cada worker ve frames no consecutivos",
+              file=sys.stderr)
+    threads = args.threads or 1
+    if args.scaling:
+        counts = [int(n) for n in args.scaling.split(',')]
+        report = scaling_report(swapper_kwargs(args), args.source, args.video, args.output, worker_counts=counts,
+                                threads_per_worker=threads, max_frames=args.max_frames)
+        for run in report['runs']:
+            print(f"{run['workers']} workers: {run['fps']:.2f} fps, x{run['speedup']:.2f} "
+                  f"(eficiencia {run['efficiency']:.0%})", file=sys.stderr)
+        print(json.dumps(report, indent=2))
+        return 0
+
+    def progress(done, total):
+        if done % 25 == 0:
+            print(f"{done}/{total or '?'} frames", file=sys.stderr)
+
+    stats = process_video_multiprocess(swapper_kwargs(args), args.source, args.video, args.output,
+                                       workers=args.processes, threads_per_worker=threads, slots=args.slots,
+                                       progress=progress, max_frames=args.max_frames)
+    print(json.dumps(stats, indent=2))
+    return 0
+
+
+def cmd_quantize(args):
+    import json
+    import os
+    import numpy as np
+    from core.quantization import check_fidelity, quantize_swapper, random_inputs, swapper_session
+    from core.runtime import SessionConfig
+    output = args.output or os.path.splitext(args.model)[0] + '.int8.onnx'
+    quantize_swapper(args.model, output)
+    config = SessionConfig(providers=['CPUExecutionProvider'])
+    reference = swapper_session(args.model, config)
+    candidate = swapper_session(output, config)
+    if args.images:
+        from core.face_swapper import FaceSwapper
+        swapper = FaceSwapper(model_path=args.model, session_config=config)
+        crops, latents = [], []
+        for path in args.images:
+            img, faces = swapper.detect_faces(path)
+            for face in faces:
+                crops.append(swapper.engine.align(img, face)[0])
+                latents.append(swapper.engine.latent(face))
+        if not crops:
+            print("No se detectaron caras en las imágenes de muestra", file=sys.stderr)
+            return 1
+        blobs, latents = swapper.engine.to_blob(crops), np.concatenate(latents)
+    else:
+        blobs, latents = random_inputs(reference)
+    report = check_fidelity(reference, candidate, blobs, latents, min_psnr=args.min_psnr)
+    report['output'] = output
+    print(json.dumps(report, indent=2))
+    return 0 if report['passed'] else 2
+
+
+def parse_resolutions(text):
+    return [tuple(int(v) for v in item.lower().split('x')) for item in text.split(',')]
+
+
+def cmd_bench(args):
+    import json
+    from core.benchmark import compare, load_report, run_benchmark, save_report
+    from core.face_swapper import FaceSwapper
+    if args.mode == 'pipeline' and not args.fixture:
+        print("El modo pipeline necesita --fixture (un retrato con una cara)", file=sys.stderr)
+        return 1
+    if not args.providers:
+        args.providers = 'CPUExecutionProvider'
+    swapper = FaceSwapper(**swapper_kwargs(args))
+    report = run_benchmark(swapper, resolutions=parse_resolutions(args.resolutions),
+                           face_counts=[int(v) for v in args.faces.split(',')], iterations=args.iterations,
+                           warmup=args.warmup, fixture_path=args.fixture, mode=args.mode)
+    if args.output:
+        save_report(report, args.output)
+    for name, case in report['cases'].items():
+        etapas = " ".join(f"{stage}={stats['p50_ms']:.1f}" for stage, stats in case['stages'].items())
+        print(f"{name}: total p50 {case['total']['p50_ms']:.1f} ms ({case['throughput_ips']:.2f} img/s, "
+              f"pico {case['peak_rss_mb']:.0f} MB) | {etapas}")
+    print(f"Pico de RSS: {report['peak_rss_mb']:.0f} MB")
+    if args.baseline:
+        regressions = compare(report, load_report(args.baseline), tolerance=args.tolerance)
+        if regressions:
+            print("Regresiones frente a la línea base:")
+            print(json.dumps(regressions, indent=2))
+            return 3
+        print("Sin regresiones frente a la línea base")
+    return 0
+
+
+def cmd_serve(args):
+    import asyncio
+    from core.face_cache import FaceCache
+    from core.face_swapper import FaceSwapper
+    from core.service import SwapService
+    from core.warmup import warm_up_async
+    swapper = FaceSwapper(face_cache=FaceCache(), max_batch=args.max_batch * 4, **swapper_kwargs(args))
+    if not args.no_warmup:
+        # Calentar las sesiones, con lotes de 1 y del máximo del motor, mientras el servicio ya
+        # acepta conexiones
+        warm = warm_up_async(swapper)
+        warm.add_done_callback(lambda f: print(
+            f"Modelos calentados en {f.result()['total_ms']:.0f} ms" if f.exception() is None
+            else f"Error al calentar los modelos: {f.exception()}", file=sys.stderr))
+    service = SwapService(swapper, max_queue=args.max_queue, batch_window_ms=args.batch_window_ms,
+                          max_batch=args.max_batch)
+    where = args.unix or f"http://{args.host}:{args.port}"
+    print(f"Servicio escuchando en {where}", file=sys.stderr)
+    try:
+        asyncio.run(service.serve(args.host, args.port, unix_path=args.unix))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def cmd_loadgen(args):
+    import json
+    from core.batch import collect_targets
+    from core.service_client import SwapClient, run_load
+    client = SwapClient(args.host, args.port, unix_path=args.unix)
+    targets = [os.path.abspath(p) for p in collect_targets(args.targets)]
+    if not targets:
+        print(f"No se encontraron imágenes en {args.targets}", file=sys.stderr)
+        return 1
+    output_dir = None
+    if args.output_dir:
+        output_dir = os.path.abspath(args.output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+    report = run_load(client, os.path.abspath(args.source), targets, requests=args.requests,
+                      concurrency=args.concurrency, inline=args.inline, output_dir=output_dir)
+    report['server'] = client.metrics()
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0 if report['errors'] == 0 else 2
+
+
+def cmd_large(args):
+    import json
+    from core.face_swapper import FaceSwapper
+    from core.large_image import LargeImageSwapper
+    from core.output_writer import OutputWriter
+    raw_shape = None
+    if args.raw_shape:
+        width, height = args.raw_shape.lower().split('x')
+        raw_shape = (int(height), int(width))
+    swapper = FaceSwapper(output_writer=OutputWriter(workers=0, fmt=args.format, quality=args.quality,
+                                                     png_compression=args.png_compression),
+                          **swapper_kwargs(args))
+    large = LargeImageSwapper(swapper, tile_size=args.tile_size, tile_overlap=args.tile_overlap,
+                              tiles=False if args.no_tiles else 'auto', refine=not args.no_refine,
+                              memory_budget_mb=args.memory_mb)
+    print(json.dumps(large.swap(args.target, args.source, args.output, raw_shape=raw_shape), indent=2))
+    return 0
+
+
+def add_endpoint_arguments(parser):
+    parser.add_argument('--host', default='127.0.0.1', help="Dirección del servicio")
+    parser.add_argument('--port', type=int, default=8765, help="Puerto del servicio")
+    parser.add_argument('--unix', help="Socket Unix en lugar de TCP")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Deepfake - Face Swapper - UDEC (modo sin interfaz)")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    batch = sub.add_parser('batch', help="Aplica una cara fuente a muchas imágenes objetivo")
+    batch.add_argument('source', help="Imagen fuente (cara a utilizar)")
+    batch.add_argument('targets', help="Directorio de imágenes objetivo o manifiesto con una ruta por línea")
+    batch.add_argument('-o', '--output-dir', default='images/generated', help="Directorio de salida")
+    batch.add_argument('-w', '--workers', type=int, default=None, help="Procesos worker (por defecto núcleos / hilos)")
+    batch.add_argument('-t', '--threads', type=int, default=1, help="Hilos de ONNX Runtime por worker")
+    batch.add_argument('--report', help="Manifiesto de resultados (.json o .csv)")
+    add_output_arguments(batch)
+    add_result_cache_arguments(batch)
+    add_model_arguments(batch)
+    batch.set_defaults(func=cmd_batch)
+
+    watch = sub.add_parser('watch', help="Vigila una carpeta y procesa cada imagen nueva que aparezca en ella")
+    watch.add_argument('source', help="Imagen fuente (cara a utilizar)")
+    watch.add_argument('input_dir', help="Carpeta vigilada")
+    watch.add_argument('-o', '--output-dir', default='images/generated', help="Directorio de salida")
+    watch.add_argument('-w', '--workers', type=int, default=None, help="Procesos worker (por defecto núcleos / hilos)")
+    watch.add_argument('-t', '--threads', type=int, default=1, help="Hilos de ONNX Runtime por worker")
+    watch.add_argument('--queue', help="Base de datos de la cola (por defecto hot_folder.sqlite en el directorio de salida)")
+    watch.add_argument('--settle', type=float, default=2.0,
+                       help="Segundos sin cambios de tamaño ni mtime para considerar que un archivo terminó de escribirse")
+    watch.add_argument('--poll', type=float, default=1.0, help="Intervalo de sondeo de la carpeta en segundos")
+    watch.add_argument('--metrics', help="Archivo JSON con la profundidad y el retraso de la cola, actualizado en cada vuelta")
+    watch.add_argument('--once', action='store_true', help="Procesar lo que haya en la carpeta y terminar")
+    add_output_arguments(watch)
+    add_result_cache_arguments(watch)
+    add_model_arguments(watch)
+    watch.set_defaults(func=cmd_watch)
+
+    video = sub.add_parser('video', help="Aplica una cara fuente a todos los frames de un vídeo")
+    video.add_argument('source', help="Imagen fuente (cara a utilizar)")
+    video.add_argument('video', help="Vídeo de entrada")
+    video.add_argument('output', help="Vídeo de salida")
+    video.add_argument('--queue-size', type=int, default=8, help="Capacidad de cada cola entre etapas")
+    video.add_argument('-t', '--threads', type=int, default=None, help="Hilos de ONNX Runtime por sesión")
+    video.add_argument('--batch-frames', type=int, default=4,
+                       help="Frames cuyas caras se agrupan en un mismo lote del modelo de swap")
+    video.add_argument('--keyframe-interval', type=int, default=1,
+                       help="Detectar solo cada N frames y seguir las caras entre medias (1 = detectar siempre)")
+    video.add_argument('--max-drift', type=float, default=0.08,
+                       help="Deriva máxima del seguimiento (fracción del ancho de la cara) antes de re-detectar")
+    video.add_argument('--processes', type=int, default=0,
+                       help="Procesos de inferencia con anillo de frames en memoria compartida (0 = hilos)")
+    video.add_argument('--slots', type=int, default=None,
+                       help="Frames en memoria compartida con --processes (por defecto 4 por proceso)")
+    video.add_argument('--scaling', default=None, metavar='N,N,...',
+                       help="Mide fps con cada número de procesos (p. ej. 1,2,4) y muestra la aceleración")
+    video.add_argument('--max-frames', type=int, default=None,
+                       help="Procesar solo los primeros N frames con --processes/--scaling")
+    add_model_arguments(video)
+    video.set_defaults(func=cmd_video)
+
+    large = sub.add_parser('large', help="Swap en imágenes muy grandes con memoria acotada (detección por teselas)")
+    large.add_argument('source', help="Imagen fuente (cara a utilizar)")
+    large.add_argument('target', help="Imagen objetivo (los TIFF sin comprimir y .raw se mapean en memoria)")
+    large.add_argument('output', help="Imagen de salida (.tif y .raw se escriben por franjas)")
+    large.add_argument('--raw-shape', help="Dimensiones ANCHOxALTO de una entrada .raw (BGR de 8 bits)")
+    large.add_argument('--tile-size', type=int, default=1280, help="Lado de las teselas de detección a resolución completa")
+    large.add_argument('--tile-overlap', type=int, default=256, help="Solape entre teselas (mayor que la cara más grande esperada)")
+    large.add_argument('--no-tiles', action='store_true', help="Detectar solo sobre la imagen reducida")
+    large.add_argument('--no-refine', action='store_true', help="No refinar a resolución completa las caras del proxy")
+    large.add_argument('--memory-mb', type=int, help="Presupuesto de memoria; se aborta si se supera")
+    large.add_argument('-t', '--threads', type=int, default=None, help="Hilos de ONNX Runtime por sesión")
+    large.add_argument('--format', choices=['png', 'jpg', 'webp', 'bmp'], help="Formato de salida si no es TIFF/raw")
+    large.add_argument('--quality', type=int, help="Calidad JPEG/WebP (1-100)")
+    large.add_argument('--png-compression', type=int, choices=range(10), metavar='0-9', help="Nivel de compresión PNG")
+    add_model_arguments(large)
+    large.set_defaults(func=cmd_large)
+
+    quantize = sub.add_parser('quantize', help="Genera una variante INT8 del swapper y comprueba su fidelidad")
+    quantize.add_argument('--model', default='models/face_swapper_model.onnx', help="Modelo FP32 de face swapper")
+    quantize.add_argument('-o', '--output', help="Ruta del modelo INT8 (por defecto <modelo>.int8.onnx)")
+    quantize.add_argument('--images', nargs='*', help="Imágenes con caras para la comprobación (por defecto entradas sintéticas)")
+    quantize.add_argument('--min-psnr', type=float, default=30.0, help="PSNR mínimo frente a FP32 para aceptar la variante")
+    quantize.set_defaults(func=cmd_quantize)
+
+    bench = sub.add_parser('bench', help="Mide cada etapa del pipeline y compara con una línea base")
+    bench.add_argument('--resolutions', default='640x480,1920x1080,3840x2160', help="Resoluciones separadas por comas")
+    bench.add_argument('--faces', default='1,4', help="Números de caras por imagen separados por comas")
+    bench.add_argument('--iterations', type=int, default=5, help="Repeticiones medidas por caso")
+    bench.add_argument('--warmup', type=int, default=1, help="Repeticiones de calentamiento descartadas")
+    bench.add_argument('--fixture', help="Retrato con una cara para rellenar las imágenes sintéticas")
+    bench.add_argument('--mode', choices=('stages', 'pipeline'), default='stages',
+                       help="stages: cada etapa por separado; pipeline: swap_faces completo (necesita --fixture)")
+    bench.add_argument('-o', '--output', help="Guardar el informe JSON (sirve como línea base)")
+    bench.add_argument('--baseline', help="Informe JSON previo con el que comparar")
+    bench.add_argument('--tolerance', type=float, default=0.10, help="Aumento relativo del p50 que cuenta como regresión")
+    bench.add_argument('-t', '--threads', type=int, default=None, help="Hilos de ONNX Runtime por sesión")
+    add_model_arguments(bench)
+    bench.set_defaults(func=cmd_bench)
+
+    serve = sub.add_parser('serve', help="Servicio local que mantiene los modelos cargados")
+    add_endpoint_arguments(serve)
+    serve.add_argument('--max-queue', type=int, default=64, help="Peticiones admitidas en cola antes de responder 503")
+    serve.add_argument('--batch-window-ms', type=float, default=10.0, help="Ventana para agrupar peticiones en un micro-lote")
+    serve.add_argument('--max-batch', type=int, default=8, help="Peticiones máximas por micro-lote")
+    serve.add_argument('-t', '--threads', type=int, default=None, help="Hilos de ONNX Runtime por sesión")
+    serve.add_argument('--no-warmup', action='store_true',
+                       help="No calentar las sesiones al arrancar (la primera petición pagará la inicialización)")
+    add_model_arguments(serve)
+    serve.set_defaults(func=cmd_serve)
+
+    loadgen = sub.add_parser('loadgen', help="Generador de carga contra el servicio local")
+    loadgen.add_argument('source', help="Imagen fuente")
+    loadgen.add_argument('targets', help="Directorio o manifiesto de imágenes objetivo")
+    add_endpoint_arguments(loadgen)
+    loadgen.add_argument('-n', '--requests', type=int, default=100, help="Número total de peticiones")
+    loadgen.add_argument('-c', '--concurrency', type=int, default=8, help="Peticiones simultáneas")
+    loadgen.add_argument('--inline', action='store_true', help="Enviar las imágenes en base64 en lugar de rutas")
+    loadgen.add_argument('-o', '--output-dir', help="Guardar los resultados en este directorio")
+    loadgen.set_defaults(func=cmd_loadgen)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
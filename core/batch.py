@@ -0,0 +1,174 @@
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# Estado por proceso: cada worker carga los modelos ONNX una sola vez.
+_worker_swapper = None
+
+
+def _init_worker(swapper_kwargs, threads_per_worker, output_options, result_cache_options):
+    global _worker_swapper
+    # Evitar que OpenCV/OpenMP lancen sus propios pools además de los de ONNX Runtime.
+    os.environ['OMP_NUM_THREADS'] = str(threads_per_worker)
+    import cv2
+    cv2.setNumThreads(1)
+    from core.face_cache import FaceCache
+    from core.face_swapper import FaceSwapper
+    from core.output_writer import OutputWriter
+    from core.result_cache import ResultCache
+    from multiprocessing.util import Finalize
+    swapper_kwargs = dict(swapper_kwargs)
+    config = swapper_kwargs.get('session_config')
+    if config is not None:
+        config.intra_op_threads, config.inter_op_threads = threads_per_worker, 1
+    else:
+        swapper_kwargs['num_threads'] = threads_per_worker
+    # La codificación y escritura de cada resultado se solapa con el swap del siguiente objetivo;
+    # las escrituras pendientes se completan antes de que el proceso termine.
+    writer = OutputWriter(**output_options)
+    Finalize(None, writer.close, exitpriority=10)
+    # Todos los workers comparten el mismo directorio de caché de resultados
+    result_cache = ResultCache(**result_cache_options) if result_cache_options else None
+    _worker_swapper = FaceSwapper(face_cache=FaceCache(), output_writer=writer, result_cache=result_cache,
+                                  **swapper_kwargs)
+
+
+def _run_job(target_path, source_path, output_path):
+    start = time.perf_counter()
+    record = {'target': target_path, 'output': output_path, 'status': 'ok', 'error': '', 'pid': os.getpid()}
+    try:
+        record['output'], _ = _worker_swapper.swap_faces(target_path, source_path, output_path)
+    except Exception as e:
+        record['status'] = 'failed'
+        record['error'] = str(e)
+    job = _worker_swapper.instrumentation.last
+    if job is not None:
+        record['stages_ms'] = job.to_dict()['stages_ms']
+        record['cached'] = job.attrs.get('result_cache') == 'hit'
+    record['seconds'] = round(time.perf_counter() - start, 4)
+    return record
+
+
+def collect_targets(targets):
+    """Devuelve la lista de imágenes objetivo de un directorio o de un manifiesto (una ruta por línea)."""
+    if os.path.isdir(targets):
+        return [os.path.join(targets, name) for name in sorted(os.listdir(targets))
+                if name.lower().endswith(IMAGE_EXTENSIONS)]
+    base_dir = os.path.dirname(os.path.abspath(targets))
+    paths = []
+    with open(targets, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                paths.append(line if os.path.isabs(line) else os.path.join(base_dir, line))
+    return paths
+
+
+def output_name(target_path, source_path, unique=False):
+    """
+    Nombre descriptivo del resultado, igual que el que genera la interfaz. Con unique se le añade un
+    hash corto de la ruta absoluta del objetivo, para objetivos que comparten nombre (a.jpg y a.png,
+    o el mismo nombre en directorios distintos de un manifiesto).
+    """
+    nombre_objetivo = os.path.splitext(os.path.basename(target_path))[0]
+    nombre_fuente = os.path.splitext(os.path.basename(source_path))[0]
+    suffix = ''
+    if unique:
+        suffix = '_' + hashlib.sha1(os.path.abspath(target_path).encode('utf-8')).hexdigest()[:8]
+    return f"swap_{nombre_objetivo}_con_{nombre_fuente}{suffix}.png"
+
+
+def output_names(target_paths, source_path):
+    """
+    Nombre de salida de cada objetivo de target_paths. Los que coincidirían con el de otro objetivo
+    reciben el de output_name(unique=True), en vez de sobrescribirse entre sí.
+    Devuelve (nombres en el orden de target_paths, {nombre compartido: objetivos que lo compartían}).
+    """
+    groups = {}
+    for target in target_paths:
+        groups.setdefault(output_name(target, source_path), []).append(target)
+    collisions = {name: targets for name, targets in groups.items() if len(targets) > 1}
+    names = []
+    for target in target_paths:
+        name = output_name(target, source_path)
+        names.append(output_name(target, source_path, unique=True) if name in collisions else name)
+    return names, collisions
+
+
+def default_workers(threads_per_worker):
+    return max(1, (os.cpu_count() or 1) // max(1, threads_per_worker))
+
+
+def run_batch(source_path, target_paths, output_dir, workers=None, threads_per_worker=1,
+              swapper_kwargs=None, log=sys.stderr, output_options=None, result_cache_options=None):
+    """
+    Aplica la cara de source_path a cada objetivo repartiendo el trabajo en un pool de procesos.
+    Cada worker usa threads_per_worker hilos de ONNX Runtime para no sobresuscribir los núcleos.
+    output_options: argumentos de OutputWriter (workers, fmt, quality, png_compression) de cada proceso;
+    por defecto un hilo de escritura por worker y PNG.
+    result_cache_options: argumentos de ResultCache (cache_dir, max_bytes); los objetivos ya procesados
+    con la misma fuente, modelos y salida se copian de la caché sin recalcularse.
+    Los objetivos que darían el mismo nombre de salida se renombran con output_names y se informa en log.
+    Devuelve un diccionario con el resumen, un registro por imagen (salida, tiempo, error) y las colisiones.
+    """
+    workers = workers or default_workers(threads_per_worker)
+    os.makedirs(output_dir, exist_ok=True)
+    names, collisions = output_names(target_paths, source_path)
+    if log is not None:
+        for name, targets in collisions.items():
+            print(f"Aviso: {len(targets)} objetivos darían {name}; se les añade un hash a la salida: "
+                  f"{', '.join(targets)}", file=log)
+    records = []
+    start = time.perf_counter()
+    output_options = {'workers': 1, **(output_options or {})}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(swapper_kwargs or {}, threads_per_worker, output_options,
+                                       result_cache_options)) as pool:
+        futures = [pool.submit(_run_job, target, source_path, os.path.join(output_dir, name))
+                   for target, name in zip(target_paths, names)]
+        for i, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            records.append(record)
+            if log is not None:
+                detalle = record['error'] or record['output']
+                print(f"[{i}/{len(futures)}] {record['status']} {record['seconds']:.2f}s {detalle}", file=log)
+    # Al cerrar el pool los workers ya vaciaron sus escrituras; como son atómicas, una salida
+    # que no existe es una escritura que falló.
+    for record in records:
+        if record['status'] == 'ok' and not os.path.exists(record['output']):
+            record['status'] = 'failed'
+            record['error'] = f"No se pudo escribir {record['output']}"
+    wall = time.perf_counter() - start
+    ok = sum(1 for r in records if r['status'] == 'ok')
+    summary = {
+        'source': source_path,
+        'total': len(records),
+        'ok': ok,
+        'failed': len(records) - ok,
+        'cached': sum(1 for r in records if r.get('cached')),
+        'renamed': sum(len(targets) for targets in collisions.values()),
+        'workers': workers,
+        'threads_per_worker': threads_per_worker,
+        'wall_seconds': round(wall, 4),
+        'images_per_second': round(len(records) / wall, 4) if wall > 0 else 0.0,
+    }
+    return {'summary': summary, 'jobs': records, 'collisions': collisions}
+
+
+def write_report(report, path):
+    """Escribe el manifiesto de resultados en JSON o CSV según la extensión."""
+    if path.lower().endswith('.csv'):
+        fields = ['target', 'output', 'status', 'error', 'seconds', 'pid']
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(report['jobs'])
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
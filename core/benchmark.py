@@ -0,0 +1,287 @@
+import json
+import os
+import platform
+import resource
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from insightface.app.common import Face
+from insightface.utils import face_align
+
+STAGES = ('imread', 'detection', 'embedding', 'swapper', 'paste_back', 'imwrite')
+# Etapas del JobRecord de FaceSwapper.swap_faces, medidas en el modo 'pipeline'
+PIPELINE_STAGES = ('load', 'detect_target', 'detect_source', 'swap', 'encode', 'write')
+MODES = ('stages', 'pipeline')
+DEFAULT_RESOLUTIONS = ((640, 480), (1920, 1080), (3840, 2160))
+DEFAULT_FACE_COUNTS = (1, 4)
+
+
+def peak_rss_mb():
+    """
+    Pico de memoria residente del proceso en MB: VmHWM de /proc/self/status, que reset_peak_rss puede
+    reiniciar, o ru_maxrss (en KB en Linux) donde no hay /proc.
+    """
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def reset_peak_rss():
+    """
+    Reinicia el pico de memoria residente (Linux: escribir 5 en /proc/self/clear_refs) para medirlo por
+    caso. Devuelve False si no se pudo: el pico medido es entonces el del proceso hasta ese momento.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding='ascii') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _grid(count):
+    cols = int(np.ceil(np.sqrt(count)))
+    rows = int(np.ceil(count / cols))
+    return cols, rows
+
+
+def synthetic_case(width, height, faces, fixture=None, seed=0):
+    """
+    Imagen de prueba con `faces` caras colocadas en rejilla. Con fixture (retrato con una cara) se
+    pega una copia por celda; sin ella el fondo es ruido suave y las caras son kps sintéticos con la
+    plantilla de ArcFace, suficientes para medir alineado, inferencia y pegado sin imágenes reales.
+    """
+    rng = np.random.default_rng(seed)
+    img = cv2.resize(rng.integers(0, 255, (height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8),
+                     (width, height), interpolation=cv2.INTER_CUBIC)
+    cols, rows = _grid(faces)
+    cell_w, cell_h = width // cols, height // rows
+    side = int(min(cell_w, cell_h) * 0.8)
+    synthetic = []
+    for i in range(faces):
+        x = (i % cols) * cell_w + (cell_w - side) // 2
+        y = (i // cols) * cell_h + (cell_h - side) // 2
+        if fixture is not None:
+            img[y:y + side, x:x + side] = cv2.resize(fixture, (side, side))
+        kps = face_align.arcface_dst * (side / 112.0) + (x, y)
+        face = Face(bbox=np.array([x, y, x + side, y + side], dtype=np.float32),
+                    kps=kps.astype(np.float32), det_score=1.0)
+        synthetic.append(face)
+    return img, synthetic
+
+
+def _summary(samples):
+    values = np.array(samples) * 1000.0
+    return {
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p90_ms': round(float(np.percentile(values, 90)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'mean_ms': round(float(values.mean()), 3),
+    }
+
+
+def run_pipeline_case(swapper, width, height, faces, iterations=5, warmup=1, fixture=None, fixture_path=None,
+                      workdir=None):
+    """
+    Mide FaceSwapper.swap_faces de extremo a extremo (hash de contenido, cachés de caras y de resultados
+    si el swapper las tiene, elección de det_size, detección, swap y OutputWriter) con el desglose por
+    etapas de su JobRecord. Necesita fixture: el detector real tiene que encontrar las caras, y el mismo
+    retrato es la fuente.
+    """
+    if fixture is None:
+        raise ValueError("El modo 'pipeline' necesita un retrato (fixture) con una cara")
+    img, _ = synthetic_case(width, height, faces, fixture=fixture)
+    input_path = os.path.join(workdir, f"bench_{width}x{height}_{faces}.png")
+    output_path = os.path.join(workdir, f"bench_{width}x{height}_{faces}_out.png")
+    cv2.imwrite(input_path, img)
+    writer = swapper.output_writer
+    timings = {stage: [] for stage in PIPELINE_STAGES}
+    totals = []
+    detected = 0
+    for iteration in range(warmup + iterations):
+        t = time.perf_counter()
+        path, _ = swapper.swap_faces(input_path, fixture_path, output_path)
+        if writer.asynchronous:
+            writer.wait(path)
+        total = time.perf_counter() - t
+        record = swapper.instrumentation.last
+        if iteration >= warmup:
+            for stage in PIPELINE_STAGES:
+                timings[stage].append(record.stages.get(stage, 0.0))
+            totals.append(total)
+            detected = record.attrs.get('faces', 0)
+
+    summary = _summary(totals)
+    return {
+        'mode': 'pipeline',
+        'resolution': [width, height],
+        'faces': faces,
+        'faces_detected': detected,
+        'iterations': iterations,
+        'stages': {stage: _summary(values) for stage, values in timings.items()},
+        'total': summary,
+        'throughput_ips': round(1000.0 / summary['p50_ms'], 3) if summary['p50_ms'] > 0 else 0.0,
+    }
+
+
+def run_case(swapper, width, height, faces, iterations=5, warmup=1, fixture=None, workdir=None):
+    """
+    Mide por separado cada etapa del pipeline (detector, reconocimiento y motor de swap llamados
+    directamente) para una resolución y un número de caras.
+    """
+    det_model = swapper.app.det_model
+    rec_model = swapper.app.models.get('recognition')
+    engine = swapper.engine
+    img, synthetic = synthetic_case(width, height, faces, fixture=fixture)
+    input_path = os.path.join(workdir, f"bench_{width}x{height}_{faces}.png")
+    output_path = os.path.join(workdir, f"bench_{width}x{height}_{faces}_out.png")
+    cv2.imwrite(input_path, img)
+    source_face = Face(bbox=synthetic[0].bbox, kps=synthetic[0].kps, det_score=1.0)
+    if rec_model is not None:
+        rec_model.get(img, source_face)
+    else:
+        source_face.embedding = np.random.default_rng(1).standard_normal(512).astype(np.float32)
+
+    timings = {stage: [] for stage in STAGES}
+    totals = []
+    for iteration in range(warmup + iterations):
+        sample = {}
+        t = time.perf_counter()
+        frame = cv2.imread(input_path)
+        sample['imread'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        bboxes, kpss = det_model.detect(frame, max_num=0, metric='default')
+        sample['detection'] = time.perf_counter() - t
+        # Con fixture se usan las caras detectadas; si no las hay, las sintéticas
+        targets = synthetic
+        if fixture is not None and bboxes.shape[0] > 0:
+            targets = [Face(bbox=bboxes[i, :4], kps=kpss[i], det_score=bboxes[i, 4])
+                       for i in range(bboxes.shape[0])]
+
+        t = time.perf_counter()
+        if rec_model is not None:
+            for face in targets:
+                rec_model.get(frame, face)
+        sample['embedding'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        aligned = [engine.align(frame, face) for face in targets]
+        fakes = engine.infer([aimg for aimg, _ in aligned], engine.latent(source_face))
+        sample['swapper'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        for (aimg, M), fake in zip(aligned, fakes):
+            engine.paste(frame, fake, aimg, M)
+        sample['paste_back'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        cv2.imwrite(output_path, frame)
+        sample['imwrite'] = time.perf_counter() - t
+
+        if iteration >= warmup:
+            for stage in STAGES:
+                timings[stage].append(sample[stage])
+            totals.append(sum(sample.values()))
+
+    total = _summary(totals)
+    return {
+        'mode': 'stages',
+        'resolution': [width, height],
+        'faces': faces,
+        'iterations': iterations,
+        'stages': {stage: _summary(values) for stage, values in timings.items()},
+        'total': total,
+        'throughput_ips': round(1000.0 / total['p50_ms'], 3) if total['p50_ms'] > 0 else 0.0,
+    }
+
+
+def run_benchmark(swapper, resolutions=DEFAULT_RESOLUTIONS, face_counts=DEFAULT_FACE_COUNTS, iterations=5,
+                  warmup=1, fixture_path=None, mode='stages'):
+    """
+    Ejecuta todos los casos (resolución x número de caras) y devuelve el informe completo, con el pico
+    de memoria residente de cada caso.
+    mode: 'stages' mide cada etapa por separado (run_case); 'pipeline' mide FaceSwapper.swap_faces
+          (run_pipeline_case, necesita fixture_path). Los casos del modo pipeline llevan el sufijo
+          '_pipeline' para no compararse con los del otro modo.
+    """
+    import onnxruntime
+    if mode not in MODES:
+        raise ValueError(f"Modo de benchmark desconocido: {mode}")
+    fixture = None
+    if fixture_path:
+        fixture = cv2.imread(fixture_path)
+        if fixture is None:
+            raise RuntimeError(f"No se pudo leer la imagen {fixture_path}")
+    cases = {}
+    with tempfile.TemporaryDirectory(prefix='faceswap_bench_') as workdir:
+        for width, height in resolutions:
+            for faces in face_counts:
+                reset_peak_rss()
+                if mode == 'pipeline':
+                    case = run_pipeline_case(swapper, width, height, faces, iterations=iterations, warmup=warmup,
+                                             fixture=fixture, fixture_path=fixture_path, workdir=workdir)
+                    name = f"{width}x{height}_f{faces}_pipeline"
+                else:
+                    case = run_case(swapper, width, height, faces, iterations=iterations, warmup=warmup,
+                                    fixture=fixture, workdir=workdir)
+                    name = f"{width}x{height}_f{faces}"
+                case['peak_rss_mb'] = round(peak_rss_mb(), 1)
+                cases[name] = case
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'onnxruntime': onnxruntime.__version__,
+            'opencv': cv2.__version__,
+            'providers': swapper.session_config.providers,
+        },
+        'cases': cases,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def compare(report, baseline, tolerance=0.10, min_delta_ms=1.0):
+    """
+    Compara el p50 de cada etapa con el de una línea base guardada. Se marca como regresión todo
+    aumento mayor que `tolerance` (relativo) y que `min_delta_ms` (absoluto, para ignorar el ruido).
+    """
+    regressions = []
+    for name, case in report['cases'].items():
+        base_case = baseline.get('cases', {}).get(name)
+        if base_case is None:
+            continue
+        entries = dict(case['stages'], total=case['total'])
+        base_entries = dict(base_case['stages'], total=base_case['total'])
+        for stage, stats in entries.items():
+            base = base_entries.get(stage)
+            if base is None:
+                continue
+            delta = stats['p50_ms'] - base['p50_ms']
+            if delta > min_delta_ms and stats['p50_ms'] > base['p50_ms'] * (1 + tolerance):
+                regressions.append({
+                    'case': name,
+                    'stage': stage,
+                    'baseline_p50_ms': base['p50_ms'],
+                    'p50_ms': stats['p50_ms'],
+                    'change': round(delta / base['p50_ms'], 3) if base['p50_ms'] > 0 else None,
+                })
+    return regressions
+
+
+def load_report(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_report(report, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,130 @@
+import hashlib
+import io
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from insightface.app.common import Face
+
+
+def content_hash(data):
+    """Hash (blake2b) del contenido de una imagen: bytes codificados o array numpy decodificado."""
+    h = hashlib.blake2b(digest_size=20)
+    if isinstance(data, np.ndarray):
+        h.update(f"{data.shape}:{data.dtype}".encode())
+        h.update(np.ascontiguousarray(data).data)
+    else:
+        h.update(data)
+    return h.hexdigest()
+
+
+def pack_faces(faces):
+    """Convierte una lista de caras en arrays compactos (bboxes, kps, scores, embeddings)."""
+    n = len(faces)
+    packed = {
+        'bbox': np.zeros((n, 4), dtype=np.float32),
+        'kps': np.zeros((n, 5, 2), dtype=np.float32),
+        'det_score': np.zeros((n,), dtype=np.float32),
+    }
+    embeddings = [face.get('embedding') for face in faces]
+    if n and all(e is not None for e in embeddings):
+        packed['embedding'] = np.stack(embeddings).astype(np.float32)
+    for i, face in enumerate(faces):
+        packed['bbox'][i] = face.bbox
+        if face.get('kps') is not None:
+            packed['kps'][i] = face.kps
+        packed['det_score'][i] = face.det_score
+    return packed
+
+
+def unpack_faces(packed):
+    """Reconstruye objetos Face nuevos a partir de los arrays de pack_faces."""
+    faces = []
+    embeddings = packed.get('embedding')
+    for i in range(len(packed['bbox'])):
+        face = Face(bbox=packed['bbox'][i].copy(), kps=packed['kps'][i].copy(),
+                    det_score=packed['det_score'][i].item())
+        if embeddings is not None:
+            face.embedding = embeddings[i].copy()
+        faces.append(face)
+    return faces
+
+
+def serialize_faces(packed):
+    """Serializa los arrays de pack_faces como un blob npz comprimido."""
+    buf = io.BytesIO()
+    np.savez_compressed(buf, **packed)
+    return buf.getvalue()
+
+
+def deserialize_faces(payload):
+    with np.load(io.BytesIO(payload)) as data:
+        return {name: data[name] for name in data.files}
+
+
+class FaceCache:
+    """
+    Caché de detecciones indexada por contenido de la imagen, det_size e identidad del modelo.
+    Guarda bbox, kps, det_score y embedding de cada cara con expulsión LRU en memoria y,
+    si se indica db_path, en un almacén sqlite (blobs npz) que sobrevive a reinicios.
+    """
+    def __init__(self, max_entries=512, db_path=None):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS faces (key TEXT PRIMARY KEY, payload BLOB NOT NULL)")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(image_hash, det_size, model_id):
+        if not isinstance(det_size, str):
+            det_size = f"{det_size[0]}x{det_size[1]}"
+        return f"{model_id}|{det_size}|{image_hash}"
+
+    def get(self, key):
+        """Devuelve una lista nueva de caras para la clave o None si no está en caché."""
+        with self._lock:
+            packed = self._entries.get(key)
+            if packed is not None:
+                self._entries.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute("SELECT payload FROM faces WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    packed = deserialize_faces(row[0])
+                    self._remember(key, packed)
+            if packed is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return unpack_faces(packed)
+
+    def put(self, key, faces):
+        packed = pack_faces(faces)
+        with self._lock:
+            self._remember(key, packed)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO faces (key, payload) VALUES (?, ?)",
+                                 (key, serialize_faces(packed)))
+                self._db.commit()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _remember(self, key, packed):
+        self._entries[key] = packed
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -1,33 +1,351 @@
+import os
 import cv2
 import numpy as np
-import insightface
-from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from core.face_cache import FaceCache, content_hash
+from core.instrumentation import Instrumentation
+from core.output_writer import OutputWriter, format_of
+from core.runtime import SessionConfig, TunedFaceAnalysis, load_model
+from core.swap_engine import BatchedSwapper
+
+# Módulos de buffalo_l que necesita el swap: cajas/kps para alinear y embedding de la cara fuente.
+SWAP_MODULES = ('detection', 'recognition')
 
 class FaceSwapper:
-    def __init__(self, det_size=(640, 640), ctx_id=0, model_path='models/face_swapper_model.onnx'):
+    def __init__(self, det_size=(640, 640), ctx_id=0, model_path='models/face_swapper_model.onnx', face_cache=None,
+                 num_threads=None, allowed_modules=SWAP_MODULES, max_batch=16, session_config=None,
+                 quantized_model_path=None, instrumentation=None, gallery_index=None, output_writer=None,
+                 result_cache=None, det_sizes=None):
         """
         model_path: Ruta al modelo ONNX de face swapper a utilizar. Debe ser configurada según el modelo disponible.
+        face_cache: FaceCache opcional para reutilizar detecciones y embeddings entre llamadas.
+        num_threads: Hilos intra-op de ONNX Runtime por sesión (None = todos los núcleos).
+        allowed_modules: Módulos de FaceAnalysis a cargar (None = todos, incluidos genderage y landmarks 3D).
+        max_batch: Número máximo de caras por llamada al modelo de swap.
+        session_config: SessionConfig para todas las sesiones ONNX (si se indica, num_threads se ignora).
+        quantized_model_path: Variante INT8 del swapper (ver core.quantization) con la que crear su sesión.
+        instrumentation: Instrumentation con los sinks donde publicar los tiempos de cada trabajo.
+        gallery_index: GalleryIndex opcional; las imágenes indexadas no vuelven a pasar por el detector.
+        output_writer: OutputWriter con el formato y la compresión de salida; si tiene hilos propios, la
+                       codificación y escritura salen del camino crítico (por defecto PNG en el hilo actual).
+        result_cache: ResultCache opcional; repetir un swap con salida ya calculado la reutiliza sin recalcularla.
+        det_sizes: Tamaños de detector adicionales; cada imagen usa el menor que cubre su lado mayor
+                   (o el mayor de todos), así las imágenes pequeñas no se amplían para detectar.
         """
-        self.app = FaceAnalysis(name='buffalo_l')
-        self.app.prepare(ctx_id=ctx_id, det_size=det_size)
-        self.swapper = insightface.model_zoo.get_model(model_path)
+        self.det_size = tuple(det_size)
+        self.det_sizes = sorted({self.det_size, *(tuple(size) for size in det_sizes or ())})
+        self.det_label = ",".join(f"{w}x{h}" for w, h in self.det_sizes)
+        self.session_config = session_config or SessionConfig(
+            intra_op_threads=num_threads, inter_op_threads=1 if num_threads else None)
+        self.app = TunedFaceAnalysis(name='buffalo_l', allowed_modules=allowed_modules, config=self.session_config)
+        self.app.prepare(ctx_id=ctx_id, det_size=self.det_size)
+        self.swapper = load_model(model_path, self.session_config, session_path=quantized_model_path)
+        if self.swapper is None:
+            raise RuntimeError(f"{model_path} no es un modelo de face swapper compatible")
+        self.engine = BatchedSwapper(self.swapper, max_batch=max_batch)
+        self.face_cache = face_cache
+        self.instrumentation = instrumentation or Instrumentation()
+        self.gallery_index = gallery_index
+        self.output_writer = output_writer or OutputWriter(workers=0)
+        self.result_cache = result_cache
+        self.model_id = self._analysis_model_id()
+        self.pipeline_id = self._pipeline_id(model_path, quantized_model_path)
 
-    def detect_faces(self, img_path):
-        img = cv2.imread(img_path)
-        faces = self.app.get(img)
-        faces = sorted(faces, key=lambda x: x.bbox[0])
-        return img, faces
+    def _analysis_model_id(self):
+        """Identidad de los modelos de análisis: nombre y tamaño de cada ONNX más el umbral de detección."""
+        parts = []
+        for taskname, model in sorted(self.app.models.items()):
+            model_file = getattr(model, 'model_file', '')
+            size = os.path.getsize(model_file) if model_file and os.path.exists(model_file) else 0
+            parts.append(f"{taskname}:{os.path.basename(model_file)}:{size}")
+        parts.append(f"thresh:{self.app.det_thresh}")
+        return ";".join(parts)
 
-    def swap_faces(self, target_img_path, source_img_path, output_path):
-        img, faces = self.detect_faces(target_img_path)
-        if len(faces) == 0:
-            raise RuntimeError(f"No se detectaron caras en {target_img_path}")
-        source_img, source_faces = self.detect_faces(source_img_path)
+    def _pipeline_id(self, model_path, quantized_model_path):
+        """Identidad de todo lo que determina un resultado: modelos de análisis, det_size y modelo de swap."""
+        parts = [self.model_id, f"det:{self.det_label}"]
+        for path in (model_path, quantized_model_path):
+            if path:
+                size = os.path.getsize(path) if os.path.exists(path) else 0
+                parts.append(f"swap:{os.path.basename(path)}:{size}")
+        return ";".join(parts)
+
+    def _result_key(self, target_data, source_data, output_path):
+        writer = self.output_writer
+        output_params = f"{format_of(output_path)}:q{writer.quality}:z{writer.png_compression}"
+        return self.result_cache.make_key(content_hash(target_data), content_hash(source_data),
+                                          self.pipeline_id, output_params)
+
+    def _store_result(self, key, output_path, future):
+        """Guarda en la caché de resultados los bytes que produjo una escritura asíncrona."""
+        if future.exception() is None:
+            self.result_cache.put(key, future.result()[1], format_of(output_path))
+
+    def det_size_for(self, img):
+        """Tamaño de detector para img: el menor que cubre su lado mayor o, si ninguno, el mayor."""
+        if len(self.det_sizes) == 1:
+            return self.det_size
+        side = max(img.shape[:2])
+        for size in self.det_sizes:
+            if min(size) >= side:
+                return size
+        return self.det_sizes[-1]
+
+    def detect(self, img):
+        """Caras de un array BGR ya decodificado, ordenadas de izquierda a derecha (sin pasar por la caché)."""
+        faces = self.app.get(img, det_size=self.det_size_for(img))
+        return sorted(faces, key=lambda x: x.bbox[0])
+
+    def _lookup(self, data):
+        """Busca en la caché las caras de una imagen codificada; devuelve (clave, caras o None)."""
+        if self.face_cache is None:
+            return None, None
+        key = FaceCache.make_key(content_hash(data), self.det_label, self.model_id)
+        return key, self.face_cache.get(key)
+
+    def _faces_for(self, data, img):
+        key, faces = self._lookup(data)
+        if faces is None:
+            faces = self.detect(img)
+            if key is not None:
+                self.face_cache.put(key, faces)
+        return faces
+
+    def analyze_bytes(self, data, name='imagen', need_image=True):
+        """
+        Busca las caras de una imagen codificada en la caché por hash de contenido y solo decodifica
+        y detecta cuando hace falta. Con need_image=False y acierto en caché no decodifica.
+        """
+        if not need_image:
+            _, faces = self._lookup(data)
+            if faces is not None:
+                return None, faces
+        img = _decode(data, name)
+        return img, self._faces_for(data, img)
+
+    def _indexed_faces(self, img_path):
+        if self.gallery_index is None or img_path is None:
+            return None
+        return self.gallery_index.faces(img_path, self)
+
+    def _load_faces(self, img_path, need_image=True):
+        faces = self._indexed_faces(img_path)
+        if faces is not None:
+            return (_decode(_read_bytes(img_path), img_path) if need_image else None), faces
+        return self.analyze_bytes(_read_bytes(img_path), img_path, need_image=need_image)
+
+    def load_image(self, image, name=None, need_image=True):
+        """
+        Caras de una imagen dada como ruta, bytes codificados o array BGR uint8 ya decodificado.
+        Devuelve (array, caras); con need_image=False el array puede ser None si no hizo falta decodificar.
+        name: ruta de la que salieron los bytes o el array; permite aprovechar el índice de la galería.
+        """
+        if isinstance(image, np.ndarray):
+            faces = self._indexed_faces(name)
+            return image, faces if faces is not None else self._faces_for(image, image)
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            data = bytes(image)
+            faces = self._indexed_faces(name)
+            if faces is not None:
+                return (_decode(data, name) if need_image else None), faces
+            return self.analyze_bytes(data, _label(image, name), need_image=need_image)
+        return self._load_faces(os.fspath(image), need_image=need_image)
+
+    def detect_faces(self, image, name=None):
+        return self.load_image(image, name)
+
+    def source_face(self, source, name=None):
+        """
+        Devuelve la primera cara de la imagen fuente (ruta, bytes o array); usa el índice
+        o la caché sin decodificar si es posible.
+        """
+        _, source_faces = self.load_image(source, name, need_image=False)
         if len(source_faces) == 0:
-            raise RuntimeError(f"No se detectaron caras en {source_img_path}")
-        source_face = source_faces[0]
-        res = img.copy()
-        for face in faces:
-            res = self.swapper.get(res, face, source_face, paste_back=True)
-        cv2.imwrite(output_path, res)
+            raise RuntimeError(f"No se detectaron caras en {_label(source, name)}")
+        return source_faces[0]
+
+    def source_face_from_bytes(self, data, name='fuente'):
+        return self.source_face(data, name)
+
+    def swap_frame(self, img, faces, source_face):
+        """Reemplaza en el sitio todas las caras detectadas de img por source_face y devuelve img."""
+        return self.engine.swap_many([(img, faces)], source_face)[0]
+
+    def swap_frames(self, frames, source_face):
+        """Como swap_frame para una lista de (img, faces); agrupa en lotes las caras de todos los frames."""
+        return self.engine.swap_many(frames, source_face)
+
+    def preview_swap(self, target, source, max_side=640, target_name=None, source_name=None):
+        """
+        Swap rápido sobre una copia reducida del objetivo (lado mayor max_side) para mostrar algo mientras
+        se calcula el resultado completo. Las caras se detectan a resolución completa (o salen del índice
+        o la caché) y se escalan, así el swap_faces posterior reutiliza las mismas detecciones.
+        Devuelve el array reducido, o None si la imagen ya cabe en max_side: entonces la vista previa
+        costaría lo mismo que el resultado completo. No escribe nada ni modifica target.
+        """
+        target_label = _label(target, target_name)
+        img, faces = self.load_image(target, target_name)
+        if len(faces) == 0:
+            raise RuntimeError(f"No se detectaron caras en {target_label}")
+        scale = max_side / max(img.shape[:2])
+        if scale >= 1.0:
+            return None
+        source_face = self.source_face(source, source_name)
+        small = cv2.resize(img, (max(1, round(img.shape[1] * scale)), max(1, round(img.shape[0] * scale))),
+                           interpolation=cv2.INTER_AREA)
+        return self.swap_frame(small, _scaled_faces(faces, scale), source_face)
+
+    def is_cached(self, target, source, output_path, target_name=None, source_name=None):
+        """True si la caché de resultados ya tiene este swap para output_path (sin leerlo)."""
+        if self.result_cache is None or output_path is None:
+            return False
+        if isinstance(source, (str, os.PathLike)):
+            source, source_name = _read_bytes(source), source_name or os.fspath(source)
+        key = self._result_key(_raw(target, _label(target, target_name)), _raw(source, _label(source, source_name)),
+                               self.output_writer.resolve_path(output_path))
+        return self.result_cache.contains(key)
+
+    def swap_faces(self, target, source, output_path=None, progress=None, cancel=None, profile=False,
+                   target_name=None, source_name=None, inplace=False):
+        """
+        target, source: ruta, bytes codificados o array BGR uint8 ya decodificado.
+        output_path: si se indica, el resultado se codifica y escribe con self.output_writer (el formato
+                     sale de su extensión salvo que el writer fije otro); si no, solo se devuelve el array.
+        progress: callback opcional progress(etapa, i, n) llamado al empezar cada etapa
+                  (load, detect_target, detect_source, swap, encode, write) y con 'done' al terminar.
+        cancel: threading.Event opcional; si se activa, el swap se interrumpe con SwapCancelled.
+        profile: captura cProfile y tracemalloc de este trabajo en su registro de instrumentación.
+        target_name, source_name: ruta de origen de un array o bytes (mensajes e índice de la galería).
+        inplace: con target como array, intercambia sobre ese mismo buffer en lugar de sobre una copia.
+        Devuelve (ruta final de salida, array resultado). Con un writer asíncrono la escritura puede
+        no haber terminado al volver (ver OutputWriter.wait).
+        """
+        hits_before = self.face_cache.hits if self.face_cache is not None else 0
+        target_label = _label(target, target_name)
+        with self.instrumentation.job('swap_faces', profile=profile, target=target_label,
+                                      source=_label(source, source_name)) as record:
+            step = _Steps(progress, cancel, record)
+            step('load')
+            data = _raw(target, target_label)
+            result_key = None
+            if output_path is not None:
+                output_path = self.output_writer.resolve_path(output_path)
+                if self.result_cache is not None:
+                    if isinstance(source, (str, os.PathLike)):
+                        source, source_name = _read_bytes(source), source_name or os.fspath(source)
+                    result_key = self._result_key(data, _raw(source, _label(source, source_name)), output_path)
+                    cached = self.result_cache.get(result_key)
+                    record.set(result_cache='miss' if cached is None else 'hit')
+                    if cached is not None:
+                        # Mismo objetivo, fuente, modelos y salida: se reutilizan los bytes ya codificados
+                        res = _decode(cached, output_path)
+                        record.set(width=res.shape[1], height=res.shape[0], output_bytes=len(cached))
+                        step('write')
+                        self.output_writer.write(output_path, cached)
+                        if inplace and data is target:
+                            target[...] = res
+                            res = target
+                        step('done')
+                        return output_path, res
+            img = data if isinstance(data, np.ndarray) else _decode(data, target_label)
+            record.set(width=img.shape[1], height=img.shape[0])
+            step('detect_target')
+            faces = self._indexed_faces(target if isinstance(target, (str, os.PathLike)) else target_name)
+            if faces is None:
+                faces = self._faces_for(data, img)
+            record.set(faces=len(faces))
+            if len(faces) == 0:
+                raise RuntimeError(f"No se detectaron caras en {target_label}")
+            step('detect_source')
+            source_face = self.source_face(source, source_name)
+            if self.face_cache is not None:
+                record.set(cache_hits=self.face_cache.hits - hits_before)
+            step('swap', 0, len(faces))
+            if img is target and not inplace:
+                img = img.copy()
+
+            def on_pasted(i, n):
+                if i + 1 < n:
+                    step('swap', i + 1, n)
+
+            res = self.engine.swap_many([(img, faces)], source_face, on_pasted=on_pasted)[0]
+            if output_path is not None:
+                writer = self.output_writer
+                if writer.asynchronous:
+                    # El resultado ya no se modifica: se codifica y escribe en segundo plano
+                    step('write')
+                    future = writer.submit(res, output_path)
+                    if result_key is not None:
+                        future.add_done_callback(
+                            lambda f, key=result_key, path=output_path: self._store_result(key, path, f))
+                else:
+                    step('encode')
+                    encoded = writer.encode(res, output_path)
+                    record.set(output_bytes=len(encoded))
+                    step('write')
+                    writer.write(output_path, encoded)
+                    if result_key is not None:
+                        self.result_cache.put(result_key, encoded, format_of(output_path))
+            step('done')
         return output_path, res
+
+
+class SwapCancelled(RuntimeError):
+    """El swap se canceló antes de terminar."""
+    status = 'cancelled'
+
+
+class _Steps:
+    """
+    Notifica el inicio de cada etapa, comprueba la cancelación en cada frontera y registra
+    la duración de cada etapa en el JobRecord de instrumentación.
+    """
+    def __init__(self, progress, cancel, record=None):
+        self.progress = progress
+        self.cancel = cancel
+        self.record = record
+
+    def __call__(self, stage, done=0, total=1):
+        if self.record is not None:
+            self.record.enter(None if stage == 'done' else stage)
+        if self.cancel is not None and self.cancel.is_set():
+            raise SwapCancelled("Face swap cancelado")
+        if self.progress is not None:
+            self.progress(stage, done, total)
+
+
+def _read_bytes(img_path):
+    with open(img_path, 'rb') as f:
+        return f.read()
+
+
+def _scaled_faces(faces, scale):
+    """Copias de las caras con caja y puntos clave escalados (solo lo necesario para alinear y pegar)."""
+    return [Face(bbox=face.bbox * scale, kps=face.kps * scale, det_score=face.det_score) for face in faces]
+
+
+def _label(image, name=None):
+    if name:
+        return str(name)
+    if isinstance(image, (str, os.PathLike)):
+        return os.fspath(image)
+    return "<array>" if isinstance(image, np.ndarray) else "<bytes>"
+
+
+def _raw(image, name):
+    """
+    Datos de una imagen de entrada sin decodificar: los bytes leídos o recibidos, o el propio array
+    si ya venía decodificado (sin copiarlo). Sirven tanto para decodificar como para las claves de caché.
+    """
+    if isinstance(image, np.ndarray):
+        if image.ndim != 3 or image.shape[2] != 3 or image.dtype != np.uint8:
+            raise RuntimeError(f"{name}: se esperaba un array BGR uint8 de 3 canales")
+        return image
+    return bytes(image) if isinstance(image, (bytes, bytearray, memoryview)) else _read_bytes(image)
+
+
+def _decode(data, img_path):
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise RuntimeError(f"No se pudo leer la imagen {img_path}")
+    return img
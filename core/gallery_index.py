@@ -0,0 +1,168 @@
+import os
+import sqlite3
+import threading
+
+import cv2
+import numpy as np
+
+from core.face_cache import deserialize_faces, pack_faces, serialize_faces, unpack_faces
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def _reduced_flag(file_size):
+    """Decodificación reducida de OpenCV para miniaturas: los JPEG grandes se decodifican a 1/2, 1/4 u 1/8."""
+    if file_size > 8 * 2 ** 20:
+        return cv2.IMREAD_REDUCED_COLOR_8
+    if file_size > 2 * 2 ** 20:
+        return cv2.IMREAD_REDUCED_COLOR_4
+    if file_size > 512 * 2 ** 10:
+        return cv2.IMREAD_REDUCED_COLOR_2
+    return cv2.IMREAD_COLOR
+
+
+class GalleryIndex:
+    """
+    Índice persistente (sqlite) de una galería de imágenes, indexado por ruta + mtime + tamaño.
+    Guarda una miniatura JPEG de cada imagen y, cuando se indexan con un FaceSwapper, sus caras
+    detectadas (bbox, kps, embedding) junto con la identidad del modelo que las produjo.
+    El escaneo es incremental: solo se reprocesan los archivos nuevos o modificados.
+    """
+    def __init__(self, db_path, thumb_size=256):
+        self.db_path = db_path
+        self.thumb_size = thumb_size
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS images (
+            path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL,
+            thumb BLOB, faces BLOB, face_count INTEGER, model_key TEXT)""")
+        self._db.commit()
+
+    @staticmethod
+    def model_key(swapper):
+        return f"{swapper.model_id}|{swapper.det_label}"
+
+    def scan(self, root, progress=None, cancel=None):
+        """
+        Recorre root y actualiza las miniaturas de los archivos nuevos o modificados; las caras de
+        esos archivos quedan pendientes de index_faces. Borra las entradas de archivos que ya no existen.
+        """
+        stats = {'unchanged': 0, 'updated': 0, 'removed': 0, 'failed': 0}
+        known = {path: (mtime_ns, size) for path, mtime_ns, size in
+                 self._query("SELECT path, mtime_ns, size FROM images WHERE path LIKE ?",
+                             (os.path.abspath(root) + os.sep + '%',))}
+        seen = set()
+        files = list(_walk_images(root))
+        for i, (path, stat) in enumerate(files):
+            if cancel is not None and cancel.is_set():
+                break
+            seen.add(path)
+            if known.get(path) == (stat.st_mtime_ns, stat.st_size):
+                stats['unchanged'] += 1
+                continue
+            try:
+                thumb = self._thumbnail(path, stat.st_size)
+            except Exception:
+                stats['failed'] += 1
+                continue
+            self._execute("INSERT OR REPLACE INTO images (path, mtime_ns, size, thumb, faces, face_count, model_key) "
+                          "VALUES (?, ?, ?, ?, NULL, NULL, NULL)", (path, stat.st_mtime_ns, stat.st_size, thumb))
+            stats['updated'] += 1
+            if progress is not None:
+                progress(i + 1, len(files))
+        if cancel is None or not cancel.is_set():
+            for path in set(known) - seen:
+                self._execute("DELETE FROM images WHERE path = ?", (path,))
+                stats['removed'] += 1
+        return stats
+
+    def index_faces(self, swapper, progress=None, cancel=None):
+        """Detecta y guarda las caras de las imágenes sin indexar o indexadas con otro modelo."""
+        key = self.model_key(swapper)
+        pending = [row[0] for row in self._query(
+            "SELECT path FROM images WHERE model_key IS NULL OR model_key != ?", (key,))]
+        done = 0
+        for i, path in enumerate(pending):
+            if cancel is not None and cancel.is_set():
+                break
+            try:
+                stat = os.stat(path)
+                img = cv2.imread(path)
+                if img is None:
+                    continue
+                faces = swapper.detect(img)
+            except Exception:
+                continue
+            # Solo se guarda si el archivo no cambió durante la detección
+            self._execute("UPDATE images SET faces = ?, face_count = ?, model_key = ? "
+                          "WHERE path = ? AND mtime_ns = ? AND size = ?",
+                          (serialize_faces(pack_faces(faces)), len(faces), key, path, stat.st_mtime_ns, stat.st_size))
+            done += 1
+            if progress is not None:
+                progress(i + 1, len(pending))
+        return done
+
+    def faces(self, path, swapper):
+        """Caras indexadas de path, o None si no está indexada, cambió en disco o se indexó con otro modelo."""
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        rows = self._query("SELECT faces FROM images WHERE path = ? AND mtime_ns = ? AND size = ? AND model_key = ?",
+                           (path, stat.st_mtime_ns, stat.st_size, self.model_key(swapper)))
+        if not rows or rows[0][0] is None:
+            return None
+        return unpack_faces(deserialize_faces(rows[0][0]))
+
+    def thumbnail(self, path):
+        rows = self._query("SELECT thumb FROM images WHERE path = ?", (os.path.abspath(path),))
+        return rows[0][0] if rows else None
+
+    def entries(self, root=None):
+        """Lista de (ruta, número de caras o None si aún no se han detectado), ordenada por ruta."""
+        if root is None:
+            return self._query("SELECT path, face_count FROM images ORDER BY path")
+        return self._query("SELECT path, face_count FROM images WHERE path LIKE ? ORDER BY path",
+                           (os.path.abspath(root) + os.sep + '%',))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _thumbnail(self, path, file_size):
+        data = np.fromfile(path, dtype=np.uint8)
+        img = cv2.imdecode(data, _reduced_flag(file_size))
+        if img is None:
+            raise RuntimeError(f"No se pudo leer la imagen {path}")
+        h, w = img.shape[:2]
+        scale = self.thumb_size / max(h, w)
+        if scale < 1:
+            img = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        if not ok:
+            raise RuntimeError(f"No se pudo generar la miniatura de {path}")
+        return encoded.tobytes()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            self._db.execute(sql, params)
+            self._db.commit()
+
+
+def _walk_images(root):
+    for dirpath, _, filenames in os.walk(os.path.abspath(root)):
+        for name in sorted(filenames):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(dirpath, name)
+                try:
+                    yield path, os.stat(path)
+                except OSError:
+                    continue
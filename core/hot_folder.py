@@ -0,0 +1,347 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from core.batch import IMAGE_EXTENSIONS, _init_worker, _run_job, default_workers, output_name
+from core.output_writer import atomic_write
+
+
+class JobQueue:
+    """
+    Cola de trabajos persistente (sqlite) de la carpeta vigilada. Cada imagen de entrada, identificada
+    por ruta + mtime + tamaño, pasa por pending -> running -> done/failed y cada transición se
+    confirma en disco, así que tras una caída o un reinicio se retoma donde se quedó: los trabajos
+    que estaban en curso vuelven a pending (o a failed si agotaron sus intentos) y los terminados no
+    se repiten.
+    """
+    def __init__(self, db_path, max_attempts=3):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._db = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT UNIQUE NOT NULL, mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,
+            output TEXT, error TEXT, enqueued_at REAL NOT NULL, started_at REAL, finished_at REAL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+        self._db.commit()
+
+    def recover(self):
+        """
+        Trabajos que quedaron en curso al interrumpirse el proceso anterior. Su intento ya se contó al
+        reclamarlos. Vuelven a pending, salvo los que agotaron max_attempts, que pasan a failed: así una
+        imagen que tumba el proceso en cada intento no se reintenta para siempre.
+        Devuelve (reencolados, fallidos).
+        """
+        with self._lock:
+            failed = self._db.execute("UPDATE jobs SET status = 'failed', finished_at = ?, "
+                                      "error = COALESCE(error, 'Interrumpido en cada intento') "
+                                      "WHERE status = 'running' AND attempts >= ?",
+                                      (time.time(), self.max_attempts)).rowcount
+            requeued = self._db.execute("UPDATE jobs SET status = 'pending', started_at = NULL "
+                                        "WHERE status = 'running'").rowcount
+            self._db.commit()
+        return requeued, failed
+
+    def enqueue(self, path, mtime_ns, size):
+        """
+        Encola path si es nuevo o si cambió desde que se encoló (mtime o tamaño distintos).
+        Devuelve True si se encoló.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT mtime_ns, size FROM jobs WHERE path = ?", (path,)).fetchone()
+            if row is not None and tuple(row) == (mtime_ns, size):
+                return False
+            self._db.execute("""INSERT OR REPLACE INTO jobs (path, mtime_ns, size, status, attempts, enqueued_at)
+                                VALUES (?, ?, ?, 'pending', 0, ?)""", (path, mtime_ns, size, time.time()))
+            self._db.commit()
+        return True
+
+    def claim(self):
+        """Marca como running el trabajo pendiente más antiguo y devuelve (id, path), o None."""
+        with self._lock:
+            row = self._db.execute("SELECT id, path FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ? "
+                             "WHERE id = ?", (time.time(), row[0]))
+            self._db.commit()
+        return row
+
+    def complete(self, job_id, output):
+        self._finish(job_id, 'done', output=output)
+
+    def fail(self, job_id, error):
+        self._finish(job_id, 'failed', error=error)
+
+    def release(self, job_id):
+        """Devuelve a pending un trabajo reclamado que no llegó a ejecutarse, sin gastar su intento."""
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = 'pending', attempts = attempts - 1, started_at = NULL "
+                             "WHERE id = ?", (job_id,))
+            self._db.commit()
+
+    def retry_or_fail(self, job_id, error):
+        """
+        Devuelve el trabajo a pending tras un fallo del worker, o lo marca failed si agotó los intentos.
+        Devuelve True si quedó failed.
+        """
+        with self._lock:
+            attempts = self._db.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+        if attempts >= self.max_attempts:
+            self.fail(job_id, error)
+            return True
+        self._finish(job_id, 'pending', error=error, finished=False)
+        return False
+
+    def _finish(self, job_id, status, output=None, error=None, finished=True):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = ?, output = ?, error = ?, finished_at = ? WHERE id = ?",
+                             (status, output, error, time.time() if finished else None, job_id))
+            self._db.commit()
+
+    def metrics(self):
+        """Profundidad de la cola por estado y retraso: antigüedad del pendiente más antiguo."""
+        now = time.time()
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = self._db.execute("SELECT MIN(enqueued_at) FROM jobs WHERE status IN ('pending', 'running')"
+                                      ).fetchone()[0]
+            latency = self._db.execute("SELECT AVG(finished_at - enqueued_at) FROM (SELECT finished_at, enqueued_at "
+                                       "FROM jobs WHERE status = 'done' ORDER BY finished_at DESC LIMIT 100)"
+                                       ).fetchone()[0]
+        return {
+            'pending': counts.get('pending', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'lag_seconds': round(now - oldest, 3) if oldest is not None else 0.0,
+            'avg_latency_seconds': round(latency, 3) if latency is not None else None,
+        }
+
+    def paths(self):
+        """Rutas de todos los trabajos de la cola, en cualquier estado."""
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT path FROM jobs").fetchall()]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class FolderWatcher:
+    """
+    Sondea una carpeta y entrega las imágenes que ya terminaron de escribirse: un archivo solo se
+    considera listo cuando su tamaño y mtime no han cambiado durante settle_seconds. Se ignoran los
+    ocultos y los temporales (.tmp, .part).
+    """
+    def __init__(self, root, settle_seconds=2.0):
+        self.root = root
+        self.settle_seconds = settle_seconds
+        self._seen = {}
+        self.waiting = 0
+
+    def poll(self):
+        """Lista de (ruta, mtime_ns, tamaño) de los archivos que se han estabilizado."""
+        now = time.monotonic()
+        ready = []
+        current = {}
+        waiting = 0
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith('.') or not name.lower().endswith(IMAGE_EXTENSIONS) or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                signature = (stat.st_mtime_ns, stat.st_size)
+                previous = self._seen.get(entry.path)
+                since = previous[1] if previous is not None and previous[0] == signature else now
+                current[entry.path] = (signature, since)
+                if now - since < self.settle_seconds:
+                    waiting += 1
+                elif stat.st_size > 0:
+                    ready.append((os.path.abspath(entry.path), stat.st_mtime_ns, stat.st_size))
+        self._seen = current
+        self.waiting = waiting
+        return ready
+
+
+class HotFolder:
+    """
+    Modo de carpeta vigilada: encola en un JobQueue cada imagen nueva de input_dir y la procesa con
+    la cara de source_path en un pool de procesos como el de core.batch (workers procesos con
+    threads_per_worker hilos de ONNX Runtime cada uno). Los resultados van a output_dir con el mismo
+    nombre que en el modo batch; si otra imagen de la cola daría ese nombre (a.jpg y a.png), con el
+    hash de output_name(unique=True). Las métricas de la cola se escriben en metrics_path (JSON) en cada vuelta.
+    Si un worker muere, sus trabajos en vuelo vuelven a pending sin gastar intento y se reintentan de uno
+    en uno: solo el que vuelve a tumbar el pool estando solo gasta intentos hasta max_attempts.
+    """
+    def __init__(self, source_path, input_dir, output_dir, queue_path=None, workers=None, threads_per_worker=1,
+                 swapper_kwargs=None, output_options=None, result_cache_options=None, settle_seconds=2.0,
+                 poll_interval=1.0, metrics_path=None, max_attempts=3, log=None):
+        self.source_path = source_path
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.workers = workers or default_workers(threads_per_worker)
+        self.threads_per_worker = threads_per_worker
+        self.swapper_kwargs = swapper_kwargs or {}
+        # Escritura síncrona: un trabajo marcado como done en la cola ya tiene su salida en disco
+        self.output_options = {**(output_options or {}), 'workers': 0}
+        self.result_cache_options = result_cache_options
+        self.poll_interval = poll_interval
+        self.metrics_path = metrics_path
+        self.queue = JobQueue(queue_path or os.path.join(output_dir, 'hot_folder.sqlite'), max_attempts=max_attempts)
+        self.watcher = FolderWatcher(input_dir, settle_seconds=settle_seconds)
+        self.log = log or logging.getLogger('faceswap')
+        self.stop = threading.Event()
+        self.processed = 0
+        self._suspects = set()
+        # Nombre de salida -> rutas de la cola que lo darían, para no sobrescribir una salida con otra
+        self._output_names = {}
+
+    def _pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(self.swapper_kwargs, self.threads_per_worker, self.output_options,
+                                             self.result_cache_options))
+
+    def _submit(self, pool, in_flight):
+        """Reparte trabajos pendientes al pool; devuelve False si el pool ya estaba roto."""
+        # Dos trabajos por worker en vuelo: ninguno espera mientras se reparte el siguiente. Tras la
+        # muerte de un worker, de uno en uno hasta resolver los trabajos sospechosos
+        limit = 1 if self._suspects else 2 * self.workers
+        while len(in_flight) < limit:
+            job = self.queue.claim()
+            if job is None:
+                if not in_flight:
+                    # Cola vacía: los sospechosos que queden se reencolaron con otro id
+                    self._suspects.clear()
+                return True
+            job_id, path = job
+            output = os.path.join(self.output_dir, self._output_name(path))
+            try:
+                in_flight[pool.submit(_run_job, path, self.source_path, output)] = job_id
+            except BrokenProcessPool:
+                self.queue.release(job_id)
+                return False
+        return True
+
+    def _register(self, path):
+        self._output_names.setdefault(output_name(path, self.source_path), set()).add(path)
+
+    def _output_name(self, path):
+        name = output_name(path, self.source_path)
+        others = self._output_names.get(name, set()) - {path}
+        if not others:
+            return name
+        unique = output_name(path, self.source_path, unique=True)
+        self.log.warning("%s daría el mismo nombre de salida que %s; se escribe como %s",
+                         path, ', '.join(sorted(others)), unique)
+        return unique
+
+    def _collect(self, done, in_flight):
+        """
+        Registra en la cola el desenlace de los futures terminados. Devuelve los id de los trabajos que
+        terminaron con BrokenProcessPool, que quedan para _crashed.
+        """
+        crashed = []
+        for future in done:
+            job_id = in_flight.pop(future)
+            if future.cancelled():
+                self.queue.release(job_id)
+                continue
+            error = future.exception()
+            if isinstance(error, BrokenProcessPool):
+                crashed.append(job_id)
+                continue
+            self._suspects.discard(job_id)
+            if error is not None:
+                self.queue.retry_or_fail(job_id, str(error) or type(error).__name__)
+                continue
+            record = future.result()
+            if record['status'] == 'ok':
+                self.queue.complete(job_id, record['output'])
+                self.processed += 1
+                self.log.info("ok %.2fs %s", record['seconds'], record['output'])
+            else:
+                self.queue.fail(job_id, record['error'])
+                self.log.warning("%s: %s", record['target'], record['error'])
+        return crashed
+
+    def _crashed(self, job_ids):
+        """
+        Trabajos que estaban en vuelo cuando murió un worker (p. ej. sin memoria o un fallo nativo al
+        decodificar). Un trabajo solo no tiene a quién culpar: gasta su intento. Con varios no se sabe
+        cuál tumbó el pool, así que vuelven a pending sin gastarlo y se reintentan de uno en uno.
+        """
+        if len(job_ids) == 1:
+            job_id = job_ids[0]
+            if self.queue.retry_or_fail(job_id, "El worker murió procesando este trabajo"):
+                self._suspects.discard(job_id)
+            else:
+                self._suspects.add(job_id)
+            return
+        for job_id in job_ids:
+            self.queue.release(job_id)
+        self._suspects.update(job_ids)
+
+    def write_metrics(self):
+        metrics = self.queue.metrics()
+        metrics['processed'] = self.processed
+        metrics['workers'] = self.workers
+        if self.metrics_path:
+            atomic_write(self.metrics_path, json.dumps(metrics, indent=2).encode('utf-8'))
+        return metrics
+
+    def run(self, once=False):
+        """
+        Vigila input_dir hasta que se active self.stop. Con once, procesa lo que haya en la carpeta
+        (una vez estabilizado) y la cola pendiente, y vuelve. Devuelve las métricas finales.
+        """
+        if os.path.realpath(self.input_dir) == os.path.realpath(self.output_dir):
+            raise ValueError("La carpeta de salida no puede ser la carpeta vigilada")
+        os.makedirs(self.output_dir, exist_ok=True)
+        requeued, failed = self.queue.recover()
+        if requeued or failed:
+            self.log.info("Se retoman %d trabajos interrumpidos (%d agotaron sus intentos)", requeued, failed)
+        for path in self.queue.paths():
+            self._register(path)
+        in_flight = {}
+        pool = self._pool()
+        try:
+            while not self.stop.is_set():
+                ready = self.watcher.poll()
+                for path, mtime_ns, size in ready:
+                    self._register(path)
+                    self.queue.enqueue(path, mtime_ns, size)
+                broken = not self._submit(pool, in_flight)
+                crashed = []
+                if in_flight:
+                    done, _ = wait(in_flight, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                    crashed = self._collect(done, in_flight)
+                elif not broken:
+                    if once and self.watcher.waiting == 0 and self.queue.metrics()['pending'] == 0:
+                        break
+                    self.stop.wait(self.poll_interval)
+                if broken or crashed:
+                    # Todos los trabajos del pool roto terminan con BrokenProcessPool
+                    self.log.error("Un worker murió; sus trabajos se reintentan en un pool nuevo")
+                    pool.shutdown(wait=True, cancel_futures=True)
+                    self._crashed(crashed + self._collect(list(in_flight), in_flight))
+                    pool = self._pool()
+                self.write_metrics()
+        finally:
+            # Los trabajos en ejecución terminan; los que no llegaron a empezar vuelven a pending
+            pool.shutdown(wait=True, cancel_futures=True)
+            self._crashed(self._collect(list(in_flight), in_flight))
+            metrics = self.write_metrics()
+            self.queue.close()
+        return metrics
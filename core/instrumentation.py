@@ -0,0 +1,209 @@
+import cProfile
+import io
+import itertools
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+
+class JobRecord:
+    """Span de un trabajo: duración por etapa y atributos (caras, dimensiones, aciertos de caché...)."""
+    def __init__(self, job_id, name, attrs):
+        self.job_id = job_id
+        self.name = name
+        self.attrs = dict(attrs)
+        self.stages = {}
+        self.started_at = time.time()
+        self.duration = None
+        self.status = 'ok'
+        self.error = None
+        self.profile = None
+        self._t0 = time.perf_counter()
+        self._stage = None
+        self._stage_t0 = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def enter(self, stage):
+        """Cierra la etapa en curso y abre `stage`; repetir la misma etapa acumula su tiempo."""
+        now = time.perf_counter()
+        if self._stage is not None:
+            self.stages[self._stage] = self.stages.get(self._stage, 0.0) + now - self._stage_t0
+        self._stage, self._stage_t0 = stage, now
+
+    @contextmanager
+    def stage(self, name):
+        self.enter(name)
+        try:
+            yield self
+        finally:
+            self.enter(None)
+
+    def finish(self, error=None):
+        self.enter(None)
+        self.duration = time.perf_counter() - self._t0
+        if error is not None:
+            self.status = getattr(error, 'status', 'error')
+            self.error = str(error)
+
+    def to_dict(self):
+        data = {
+            'job_id': self.job_id,
+            'name': self.name,
+            'status': self.status,
+            'started_at': round(self.started_at, 3),
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            'stages_ms': {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()},
+            'attrs': self.attrs,
+        }
+        if self.error:
+            data['error'] = self.error
+        if self.profile:
+            data['profile'] = self.profile
+        return data
+
+
+class LogSink:
+    """Escribe cada trabajo como una línea JSON en un logger."""
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('faceswap')
+        self.level = level
+
+    def emit(self, record):
+        self.logger.log(self.level, json.dumps(record.to_dict(), ensure_ascii=False, default=str))
+
+
+class RingBufferSink:
+    """Guarda en memoria los últimos `capacity` trabajos."""
+    def __init__(self, capacity=256):
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(record.to_dict())
+
+
+class PrometheusFileSink:
+    """
+    Mantiene contadores acumulados y los vuelca en formato de texto de Prometheus a un fichero
+    (para el textfile collector de node_exporter). El fichero se reemplaza de forma atómica.
+    """
+    def __init__(self, path, prefix='faceswap'):
+        self.path = path
+        self.prefix = prefix
+        self.jobs = {}
+        self.stage_seconds = {}
+        self.stage_count = {}
+        self.job_seconds = 0.0
+        self.faces = 0
+        self.cache_hits = 0
+
+    def emit(self, record):
+        self.jobs[record.status] = self.jobs.get(record.status, 0) + 1
+        self.job_seconds += record.duration or 0.0
+        self.faces += int(record.attrs.get('faces', 0))
+        self.cache_hits += int(record.attrs.get('cache_hits', 0))
+        for stage, seconds in record.stages.items():
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+            self.stage_count[stage] = self.stage_count.get(stage, 0) + 1
+        self._write()
+
+    def _write(self):
+        p = self.prefix
+        lines = [f"# TYPE {p}_jobs_total counter"]
+        lines += [f'{p}_jobs_total{{status="{status}"}} {count}' for status, count in sorted(self.jobs.items())]
+        lines += [f"# TYPE {p}_job_seconds_total counter", f"{p}_job_seconds_total {self.job_seconds:.6f}"]
+        lines += [f"# TYPE {p}_stage_seconds summary"]
+        for stage in sorted(self.stage_seconds):
+            lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {self.stage_seconds[stage]:.6f}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {self.stage_count[stage]}')
+        lines += [f"# TYPE {p}_faces_total counter", f"{p}_faces_total {self.faces}"]
+        lines += [f"# TYPE {p}_cache_hits_total counter", f"{p}_cache_hits_total {self.cache_hits}"]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
+
+
+class Instrumentation:
+    """
+    Punto de instrumentación del camino caliente de FaceSwapper. Cada trabajo abre un JobRecord con
+    sus etapas y se entrega a los sinks al terminar; `last` conserva el último trabajo.
+    Con profile=True en job() se capturan cProfile y tracemalloc solo para ese trabajo
+    (tracemalloc es global: perfilar un solo trabajo a la vez).
+    """
+    def __init__(self, sinks=(), profile_dir=None, profile_top=15):
+        self.sinks = list(sinks)
+        self.profile_dir = profile_dir
+        self.profile_top = profile_top
+        self.last = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    @contextmanager
+    def job(self, name, profile=False, **attrs):
+        record = JobRecord(next(self._ids), name, attrs)
+        profiler = self._start_profile() if profile else None
+        try:
+            yield record
+        except BaseException as e:
+            record.finish(error=e)
+            raise
+        else:
+            record.finish()
+        finally:
+            if profiler is not None:
+                record.profile = self._stop_profile(profiler, record)
+            self._emit(record)
+
+    def start(self, name, **attrs):
+        """Abre un JobRecord para un trabajo que no cabe en un bloque with (repartido entre hilos); cerrarlo con end()."""
+        return JobRecord(next(self._ids), name, attrs)
+
+    def end(self, record, error=None):
+        record.finish(error=error)
+        self._emit(record)
+
+    def _emit(self, record):
+        with self._lock:
+            self.last = record
+            for sink in self.sinks:
+                try:
+                    sink.emit(record)
+                except Exception:
+                    logging.getLogger('faceswap').exception("Error en un sink de instrumentación")
+
+    def _start_profile(self):
+        tracemalloc.start()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _stop_profile(self, profiler, record):
+        profiler.disable()
+        current, peak = tracemalloc.get_traced_memory()
+        top_allocations = tracemalloc.take_snapshot().statistics('lineno')[:self.profile_top]
+        tracemalloc.stop()
+        out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=out).sort_stats('cumulative')
+        stats.print_stats(self.profile_top)
+        result = {
+            'cpu_top': out.getvalue(),
+            'alloc_peak_mb': round(peak / 2 ** 20, 2),
+            'alloc_top': [str(stat) for stat in top_allocations],
+        }
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f"job-{record.job_id}.prof")
+            stats.dump_stats(path)
+            result['pstats_file'] = path
+        return result
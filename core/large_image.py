@@ -0,0 +1,293 @@
+import os
+import resource
+import time
+
+import cv2
+import numpy as np
+from insightface.app.common import Face
+
+from core.tracker import iou
+
+TIFF_EXTENSIONS = ('.tif', '.tiff')
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    """El proceso superó el presupuesto de memoria del modo de imágenes grandes."""
+    status = 'memory'
+
+
+class MemoryBudget:
+    """
+    Comprueba la memoria anónima del proceso (RssAnon: lo que no es un archivo mapeado) en cada
+    etapa y lanza MemoryBudgetExceeded si supera limit_mb. Las páginas de un memmap que solo se leen
+    no cuentan, porque el sistema puede liberarlas en cualquier momento; las que se modifican sí.
+    """
+    def __init__(self, limit_mb=None):
+        self.limit_mb = limit_mb
+        self.peak_anon_mb = 0.0
+
+    def check(self, stage):
+        anon = anon_rss_mb()
+        self.peak_anon_mb = max(self.peak_anon_mb, anon)
+        if self.limit_mb is not None and anon > self.limit_mb:
+            raise MemoryBudgetExceeded(
+                f"Memoria en uso {anon:.0f} MB tras '{stage}' supera el presupuesto de {self.limit_mb} MB")
+        return anon
+
+    def require(self, nbytes, what):
+        """Falla antes de reservar nbytes si la reserva haría superar el presupuesto."""
+        if self.limit_mb is not None and anon_rss_mb() + nbytes / 2 ** 20 > self.limit_mb:
+            raise MemoryBudgetExceeded(
+                f"{what} necesita {nbytes / 2 ** 20:.0f} MB y superaría el presupuesto de {self.limit_mb} MB")
+
+
+def anon_rss_mb():
+    """Memoria residente anónima del proceso en MB (Linux); en otros sistemas, el pico de RSS."""
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('RssAnon:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def open_image(path, raw_shape=None, budget=None):
+    """
+    Abre una imagen como array BGR uint8 (alto x ancho x 3) y devuelve (array, mapeada).
+    Los TIFF sin comprimir y los .raw (BGR entrelazado, raw_shape=(alto, ancho)) se mapean en memoria
+    en modo copy-on-write: solo se leen las páginas que se usan y pegar caras no modifica el archivo.
+    El resto de formatos se decodifica completo.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.raw':
+        if raw_shape is None:
+            raise ValueError("Las imágenes .raw necesitan raw_shape=(alto, ancho)")
+        return np.memmap(path, dtype=np.uint8, mode='c', shape=(raw_shape[0], raw_shape[1], 3)), True
+    if ext in TIFF_EXTENSIONS:
+        import tifffile
+        try:
+            data = tifffile.memmap(path, mode='c')
+        except ValueError:
+            data = None
+        if data is not None and data.ndim == 3 and data.shape[2] in (3, 4) and data.dtype == np.uint8:
+            # Vista BGR sin copia sobre los datos RGB(A) del archivo
+            return data[..., 2::-1], True
+        with tifffile.TiffFile(path) as tif:
+            page = tif.pages[0]
+            if budget is not None:
+                budget.require(int(np.prod(page.shape)) * page.dtype.itemsize, "Decodificar el TIFF")
+            data = page.asarray()
+        return _to_bgr(data, path), False
+    img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise RuntimeError(f"No se pudo leer la imagen {path}")
+    return img, False
+
+
+def _to_bgr(data, path):
+    if data.dtype != np.uint8:
+        raise RuntimeError(f"{path}: solo se admiten imágenes de 8 bits")
+    if data.ndim == 2:
+        return cv2.cvtColor(data, cv2.COLOR_GRAY2BGR)
+    if data.shape[2] == 4:
+        return cv2.cvtColor(data, cv2.COLOR_RGBA2BGR)
+    return cv2.cvtColor(data, cv2.COLOR_RGB2BGR)
+
+
+def downscale(img, scale, strip_rows=512):
+    """
+    Reduce img por franjas horizontales: nunca hay más de strip_rows filas de la imagen original
+    copiadas a la vez, así que sirve para memmaps y vistas no contiguas.
+    """
+    h, w = img.shape[:2]
+    out_w, out_h = max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+    out = np.empty((out_h, out_w, 3), dtype=np.uint8)
+    step = max(1, int(strip_rows * scale))
+    for o0 in range(0, out_h, step):
+        o1 = min(out_h, o0 + step)
+        r0 = min(h - 1, int(round(o0 / scale)))
+        r1 = max(r0 + 1, min(h, int(round(o1 / scale))))
+        strip = np.ascontiguousarray(img[r0:r1])
+        out[o0:o1] = cv2.resize(strip, (out_w, o1 - o0), interpolation=cv2.INTER_AREA)
+    return out
+
+
+def write_image(img, path, writer, strip_rows=512):
+    """
+    Escribe el resultado. Los TIFF (sin comprimir) y .raw se escriben por franjas desde el buffer,
+    sin copia completa; el resto de formatos se codifica con el OutputWriter del swapper, que
+    necesita la imagen contigua en memoria. Devuelve la ruta final.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    h, w = img.shape[:2]
+    if ext not in TIFF_EXTENSIONS and ext != '.raw':
+        return writer.save(np.ascontiguousarray(img), path)[0]
+    output_dir = os.path.dirname(path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        if ext == '.raw':
+            with open(tmp_path, 'wb') as f:
+                for r0 in range(0, h, strip_rows):
+                    f.write(np.ascontiguousarray(img[r0:r0 + strip_rows]).tobytes())
+        else:
+            import tifffile
+            out = tifffile.memmap(tmp_path, shape=(h, w, 3), dtype=np.uint8, photometric='rgb')
+            for r0 in range(0, h, strip_rows):
+                out[r0:r0 + strip_rows] = img[r0:r0 + strip_rows, :, ::-1]
+            out.flush()
+            del out
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+class LargeImageSwapper:
+    """
+    Modo de imágenes muy grandes sobre un FaceSwapper ya cargado, con memoria acotada:
+    - La detección se hace sobre una versión reducida (proxy) con el lado mayor igual a det_size y,
+      si la imagen es mayor que una tesela, también sobre teselas solapadas a resolución completa para
+      encontrar caras pequeñas. Las cajas se llevan a coordenadas de la imagen completa y se fusionan con NMS.
+    - Las caras halladas en el proxy se refinan detectando de nuevo en un recorte a resolución completa.
+    - Alineado y pegado leen y escriben solo la región de cada cara, en el sitio, sobre un único buffer
+      (la imagen decodificada o el memmap copy-on-write de un TIFF/raw).
+    - memory_budget_mb acota la memoria anónima del proceso en cada etapa.
+    """
+    def __init__(self, swapper, tile_size=1280, tile_overlap=256, tiles='auto', refine=True,
+                 memory_budget_mb=None):
+        self.swapper = swapper
+        self.det_model = swapper.app.det_model
+        self.det_size = tuple(swapper.det_size)
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.tiles = tiles
+        self.refine = refine
+        self.memory_budget_mb = memory_budget_mb
+
+    def _detect_region(self, img, x0, y0, x1, y1, input_size=None):
+        """Detecta en img[y0:y1, x0:x1] y devuelve (cajas con score, kps) en coordenadas de img."""
+        crop = np.ascontiguousarray(img[y0:y1, x0:x1])
+        det, kpss = self.det_model.detect(crop, input_size=input_size or self.det_size, max_num=0)
+        det[:, [0, 2]] += x0
+        det[:, [1, 3]] += y0
+        kpss = kpss + np.array([x0, y0], dtype=kpss.dtype)
+        return det, kpss
+
+    def _use_tiles(self, scale):
+        if self.tiles == 'auto':
+            return scale < max(self.det_size) / self.tile_size
+        return bool(self.tiles)
+
+    def _tile_origins(self, length):
+        stride = self.tile_size - self.tile_overlap
+        origins = list(range(0, max(1, length - self.tile_overlap), stride))
+        if origins[-1] + self.tile_size < length:
+            origins.append(length - self.tile_size)
+        return origins
+
+    def detect(self, img, budget=None):
+        """Caras de img en coordenadas de la imagen completa, ordenadas por x. Devuelve (caras, info)."""
+        budget = budget or MemoryBudget(self.memory_budget_mb)
+        h, w = img.shape[:2]
+        scale = min(1.0, max(self.det_size) / max(h, w))
+        proxy = downscale(img, scale) if scale < 1.0 else np.ascontiguousarray(img)
+        det, kpss = self.det_model.detect(proxy, input_size=self.det_size, max_num=0)
+        del proxy
+        det[:, :4] /= scale
+        kpss = kpss / scale
+        budget.check('proxy')
+        if self.refine and scale < 1.0:
+            det, kpss = self._refine(img, det, kpss)
+        dets, kps_list = [det], [kpss]
+        tile_count = 0
+        if self._use_tiles(scale):
+            for ty in self._tile_origins(h):
+                for tx in self._tile_origins(w):
+                    x1, y1 = min(w, tx + self.tile_size), min(h, ty + self.tile_size)
+                    tdet, tkps = self._detect_region(img, tx, ty, x1, y1)
+                    # Las caras cortadas por un borde interior aparecen enteras en la tesela vecina
+                    inner = np.ones(len(tdet), dtype=bool)
+                    if tx > 0:
+                        inner &= tdet[:, 0] > tx + 2
+                    if ty > 0:
+                        inner &= tdet[:, 1] > ty + 2
+                    if x1 < w:
+                        inner &= tdet[:, 2] < x1 - 2
+                    if y1 < h:
+                        inner &= tdet[:, 3] < y1 - 2
+                    dets.append(tdet[inner])
+                    kps_list.append(tkps[inner])
+                    tile_count += 1
+            budget.check('tiles')
+        det = np.vstack(dets).astype(np.float32)
+        kpss = np.vstack(kps_list)
+        keep = self.det_model.nms(det) if len(det) else []
+        faces = [Face(bbox=det[i, :4], kps=kpss[i], det_score=float(det[i, 4])) for i in keep]
+        faces.sort(key=lambda face: face.bbox[0])
+        return faces, {'proxy_scale': round(scale, 4), 'tiles': tile_count}
+
+    def _refine(self, img, det, kpss):
+        """Repite la detección de cada cara del proxy en un recorte a resolución completa (kps más precisos)."""
+        h, w = img.shape[:2]
+        refined_det, refined_kps = det.copy(), kpss.copy()
+        for i, box in enumerate(det):
+            bw, bh = box[2] - box[0], box[3] - box[1]
+            x0, y0 = max(0, int(box[0] - bw)), max(0, int(box[1] - bh))
+            x1, y1 = min(w, int(box[2] + bw)), min(h, int(box[3] + bh))
+            if x1 <= x0 or y1 <= y0:
+                continue
+            rdet, rkps = self._detect_region(img, x0, y0, x1, y1)
+            if len(rdet) == 0:
+                continue
+            best = int(np.argmax([iou(box, r) for r in rdet]))
+            if iou(box, rdet[best]) > 0.3:
+                refined_det[i], refined_kps[i] = rdet[best], rkps[best]
+        return refined_det, refined_kps
+
+    def swap(self, target_path, source, output_path, raw_shape=None):
+        """
+        Intercambia todas las caras de target_path por la primera de source y escribe output_path.
+        Devuelve un diccionario con dimensiones, caras, teselas, tiempos y pico de memoria.
+        """
+        budget = MemoryBudget(self.memory_budget_mb)
+        start = time.perf_counter()
+        with self.swapper.instrumentation.job('swap_large', target=target_path, source=str(source)) as record:
+            record.enter('load')
+            img, mapped = open_image(target_path, raw_shape, budget)
+            budget.check('load')
+            record.set(width=img.shape[1], height=img.shape[0], memmap=mapped)
+            record.enter('detect_target')
+            faces, info = self.detect(img, budget)
+            record.set(faces=len(faces), **info)
+            if len(faces) == 0:
+                raise RuntimeError(f"No se detectaron caras en {target_path}")
+            record.enter('detect_source')
+            source_face = self.swapper.source_face(source)
+            record.enter('swap')
+            self.swapper.engine.swap_many([(img, faces)], source_face)
+            budget.check('swap')
+            record.enter('write')
+            output_path = write_image(img, output_path, self.swapper.output_writer)
+            budget.check('write')
+            record.enter(None)
+        stats = dict(record.attrs)
+        stats.update({
+            'output': output_path,
+            'seconds': round(time.perf_counter() - start, 3),
+            'stages_ms': record.to_dict()['stages_ms'],
+            'peak_anon_mb': round(budget.peak_anon_mb, 1),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'memory_budget_mb': self.memory_budget_mb,
+        })
+        return stats
+
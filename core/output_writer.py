@@ -0,0 +1,175 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import cv2
+
+FORMATS = {'png': '.png', 'jpg': '.jpg', 'jpeg': '.jpg', 'webp': '.webp', 'bmp': '.bmp'}
+
+_tmp_ids = itertools.count()
+
+
+def format_of(path):
+    """Extensión normalizada del formato de path ('.jpeg' -> '.jpg'; sin extensión o desconocida, PNG)."""
+    return FORMATS.get(os.path.splitext(path)[1].lower().lstrip('.'), '.png')
+
+
+def encode_params(ext, quality=None, png_compression=None):
+    """Parámetros de cv2.imencode para la extensión: nivel de compresión PNG (0-9) o calidad JPEG/WebP (1-100)."""
+    ext = ext.lower()
+    if ext == '.png' and png_compression is not None:
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+    if ext in ('.jpg', '.jpeg') and quality is not None:
+        return [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    if ext == '.webp' and quality is not None:
+        return [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    return []
+
+
+def atomic_write(path, data):
+    """Escribe en un archivo temporal del mismo directorio y lo renombra: nunca queda un archivo a medias."""
+    output_dir = os.path.dirname(path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{next(_tmp_ids)}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class OutputWriter:
+    """
+    Etapa de salida: codifica los resultados con el formato y la compresión elegidos y los escribe
+    de forma atómica. Con workers > 0 lo hace en un pool de hilos (cv2.imencode libera el GIL) y
+    submit vuelve enseguida; como mucho max_pending resultados esperan en memoria y, si se llega
+    al límite, submit bloquea hasta que se libere uno. Con workers = 0 escribe en el hilo que llama.
+
+    fmt: formato forzado ('png', 'jpg', 'webp', 'bmp'); cambia la extensión de las rutas. Si es None,
+         el formato sale de la extensión de cada ruta.
+    quality: calidad JPEG/WebP (1-100; WebP > 100 = sin pérdida). None = valor por defecto de OpenCV.
+    png_compression: nivel de compresión PNG (0-9). None = valor por defecto de OpenCV.
+    """
+    def __init__(self, workers=1, fmt=None, quality=None, png_compression=None, max_pending=None):
+        if fmt is not None and fmt.lower() not in FORMATS:
+            raise ValueError(f"Formato de salida no soportado: {fmt}")
+        self.workers = workers
+        self.fmt = fmt.lower() if fmt else None
+        self.quality = quality
+        self.png_compression = png_compression
+        self.written = 0
+        self.failed = 0
+        self.bytes_written = 0
+        self.encode_seconds = 0.0
+        self.write_seconds = 0.0
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._pool = None
+        self._slots = None
+        if workers > 0:
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='output-writer')
+            self._slots = threading.BoundedSemaphore(max_pending or 2 * workers)
+
+    @property
+    def asynchronous(self):
+        return self._pool is not None
+
+    def resolve_path(self, path):
+        """Ruta final del resultado: con fmt fijado se sustituye la extensión."""
+        if self.fmt is None:
+            return path
+        return os.path.splitext(path)[0] + FORMATS[self.fmt]
+
+    def encode(self, img, path):
+        """Codifica img según la extensión de path (por defecto PNG) y devuelve los bytes."""
+        start = time.perf_counter()
+        ext = os.path.splitext(path)[1].lower() or '.png'
+        ok, encoded = cv2.imencode(ext, img, encode_params(ext, self.quality, self.png_compression))
+        if not ok:
+            raise RuntimeError(f"No se pudo codificar la imagen {path}")
+        with self._lock:
+            self.encode_seconds += time.perf_counter() - start
+        return encoded.tobytes()
+
+    def write(self, path, data):
+        start = time.perf_counter()
+        atomic_write(path, data)
+        with self._lock:
+            self.write_seconds += time.perf_counter() - start
+            self.written += 1
+            self.bytes_written += len(data)
+
+    def save(self, img, path):
+        """Codifica y escribe en el hilo actual; devuelve (ruta, bytes codificados)."""
+        path = self.resolve_path(path)
+        try:
+            data = self.encode(img, path)
+            self.write(path, data)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        return path, data
+
+    def submit(self, img, path):
+        """
+        Encola la codificación y escritura de img (que no debe modificarse después) y devuelve un
+        Future con (ruta, bytes). Sin pool se resuelve en el acto.
+        """
+        path = self.resolve_path(path)
+        if self._pool is None:
+            future = Future()
+            try:
+                future.set_result(self.save(img, path))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        self._slots.acquire()
+        future = self._pool.submit(self.save, img, path)
+        with self._lock:
+            self._in_flight[path] = future
+        future.add_done_callback(lambda f, path=path: self._done(path, f))
+        return future
+
+    def wait(self, path):
+        """Espera a que termine la escritura pendiente de path, si la hay."""
+        with self._lock:
+            future = self._in_flight.get(self.resolve_path(path))
+        if future is not None:
+            future.exception()
+
+    def flush(self):
+        with self._lock:
+            pending = list(self._in_flight.values())
+        for future in pending:
+            future.exception()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'written': self.written,
+                'failed': self.failed,
+                'pending': len(self._in_flight),
+                'bytes': self.bytes_written,
+                'encode_ms': round(self.encode_seconds * 1000, 2),
+                'write_ms': round(self.write_seconds * 1000, 2),
+            }
+
+    def _done(self, path, future):
+        with self._lock:
+            if self._in_flight.get(path) is future:
+                del self._in_flight[path]
+        self._slots.release()
+        if future.exception() is not None:
+            logging.getLogger('faceswap').error("Error al escribir %s: %s", path, future.exception())
@@ -0,0 +1,54 @@
+import numpy as np
+import onnxruntime
+
+
+def quantize_swapper(model_path, output_path):
+    """Genera una variante INT8 (cuantización dinámica de pesos) del modelo de swap."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(model_path, output_path, weight_type=QuantType.QInt8)
+    return output_path
+
+
+def random_inputs(session, samples=8, seed=0):
+    """Recortes y latentes sintéticos con la forma de entrada del swapper (para comprobar sin imágenes)."""
+    rng = np.random.default_rng(seed)
+    inputs = session.get_inputs()
+    size = inputs[0].shape[2]
+    latent_dim = inputs[1].shape[1]
+    blobs = rng.random((samples, 3, size, size), dtype=np.float32)
+    latents = rng.standard_normal((samples, latent_dim)).astype(np.float32)
+    latents /= np.linalg.norm(latents, axis=1, keepdims=True)
+    return blobs, latents
+
+
+def check_fidelity(reference, candidate, blobs, latents, min_psnr=30.0):
+    """
+    Compara la salida de dos sesiones del swapper (FP32 frente a INT8) sobre los mismos recortes.
+    Devuelve el error medio y máximo en niveles de gris (0-255), el PSNR medio y si supera min_psnr.
+    """
+    names = [i.name for i in reference.get_inputs()]
+    errors, peaks, psnrs = [], [], []
+    for blob, latent in zip(blobs, latents):
+        feed = {names[0]: blob[None], names[1]: latent[None]}
+        ref = np.clip(reference.run(None, feed)[0], 0, 1) * 255
+        out = np.clip(candidate.run(None, feed)[0], 0, 1) * 255
+        diff = np.abs(ref - out)
+        mse = float(np.mean(diff ** 2))
+        errors.append(float(diff.mean()))
+        peaks.append(float(diff.max()))
+        psnrs.append(99.0 if mse == 0 else 10 * np.log10(255.0 ** 2 / mse))
+    psnr = float(np.mean(psnrs))
+    return {
+        'samples': len(errors),
+        'mean_abs_error': round(float(np.mean(errors)), 4),
+        'max_abs_error': round(float(np.max(peaks)), 4),
+        'psnr_db': round(psnr, 2),
+        'min_psnr_db': min_psnr,
+        'passed': psnr >= min_psnr,
+    }
+
+
+def swapper_session(model_path, config):
+    """Sesión del swapper sin envolver en INSwapper, para comparar variantes directamente."""
+    onnxruntime.set_default_logger_severity(3)
+    return config.create_session(model_path)
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from core.output_writer import atomic_write
+
+
+class ResultCache:
+    """
+    Caché en disco de resultados de swap ya codificados, indexada por el hash del contenido del
+    objetivo y de la fuente, la identidad de los modelos y los parámetros de salida. Cada entrada
+    es un archivo en cache_dir; un índice sqlite guarda su tamaño y último acceso para expulsar
+    las menos usadas cuando el total supera max_bytes. Varios procesos pueden compartir el directorio.
+    """
+    def __init__(self, cache_dir, max_bytes=1024 * 2 ** 20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), timeout=30, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS results (
+            key TEXT PRIMARY KEY, filename TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)""")
+        self._db.commit()
+
+    @staticmethod
+    def make_key(target_hash, source_hash, pipeline_id, output_params):
+        return f"{pipeline_id}|{output_params}|{target_hash}|{source_hash}"
+
+    def get(self, key):
+        """Bytes codificados del resultado o None. Una entrada cuyo archivo desapareció cuenta como fallo."""
+        with self._lock:
+            row = self._db.execute("SELECT filename FROM results WHERE key = ?", (key,)).fetchone()
+            data = None
+            if row is not None:
+                try:
+                    with open(os.path.join(self.cache_dir, row[0]), 'rb') as f:
+                        data = f.read()
+                except OSError:
+                    self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                else:
+                    self._db.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+                self._db.commit()
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return data
+
+    def contains(self, key):
+        """True si hay una entrada para key, sin leerla ni contarla como acierto o fallo."""
+        with self._lock:
+            row = self._db.execute("SELECT filename FROM results WHERE key = ?", (key,)).fetchone()
+        return row is not None and os.path.exists(os.path.join(self.cache_dir, row[0]))
+
+    def put(self, key, data, ext='.png'):
+        if len(data) > self.max_bytes:
+            return
+        filename = f"{_digest(key)}{ext}"
+        atomic_write(os.path.join(self.cache_dir, filename), data)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO results (key, filename, size, last_access) VALUES (?, ?, ?, ?)",
+                             (key, filename, len(data), time.time()))
+            self._db.commit()
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+                'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, filename, size in self._db.execute(
+                "SELECT key, filename, size FROM results ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, filename))
+            except OSError:
+                pass
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+        self._db.commit()
+
+
+def _digest(key):
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=20).hexdigest()
@@ -0,0 +1,156 @@
+import glob
+import hashlib
+import os
+import platform
+import onnxruntime
+from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from insightface.model_zoo import model_zoo
+from insightface.model_zoo.arcface_onnx import ArcFaceONNX
+from insightface.model_zoo.attribute import Attribute
+from insightface.model_zoo.inswapper import INSwapper
+from insightface.model_zoo.landmark import Landmark
+from insightface.model_zoo.retinaface import RetinaFace
+from insightface.utils import ensure_available
+
+OPTIMIZATION_LEVELS = {
+    'disable': onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+class SessionConfig:
+    """
+    Configuración de las sesiones de ONNX Runtime que respetan tanto FaceAnalysis como el swapper:
+    proveedores de ejecución, hilos intra/inter-op, nivel de optimización del grafo, modo de
+    ejecución y comportamiento del arena de memoria.
+    Con optimized_cache_dir, el grafo optimizado de cada modelo se serializa en disco la primera vez
+    y los arranques siguientes lo cargan directamente sin volver a optimizar.
+    """
+    def __init__(self, providers=None, intra_op_threads=None, inter_op_threads=None, optimization_level='all',
+                 parallel_execution=False, enable_cpu_mem_arena=True, enable_mem_pattern=True,
+                 optimized_cache_dir=None):
+        if optimization_level not in OPTIMIZATION_LEVELS:
+            raise ValueError(f"Nivel de optimización desconocido: {optimization_level}")
+        self.providers = providers or model_zoo.get_default_providers()
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.optimization_level = optimization_level
+        self.parallel_execution = parallel_execution
+        self.enable_cpu_mem_arena = enable_cpu_mem_arena
+        self.enable_mem_pattern = enable_mem_pattern
+        self.optimized_cache_dir = optimized_cache_dir
+
+    def session_options(self):
+        so = onnxruntime.SessionOptions()
+        if self.intra_op_threads:
+            so.intra_op_num_threads = int(self.intra_op_threads)
+        if self.inter_op_threads:
+            so.inter_op_num_threads = int(self.inter_op_threads)
+        so.graph_optimization_level = OPTIMIZATION_LEVELS[self.optimization_level]
+        so.execution_mode = (onnxruntime.ExecutionMode.ORT_PARALLEL if self.parallel_execution
+                             else onnxruntime.ExecutionMode.ORT_SEQUENTIAL)
+        so.enable_cpu_mem_arena = self.enable_cpu_mem_arena
+        so.enable_mem_pattern = self.enable_mem_pattern
+        return so
+
+    def optimized_path(self, model_path):
+        """Ruta del grafo optimizado en caché; depende del modelo, la versión de ORT, el nivel y el hardware."""
+        stat = os.stat(model_path)
+        key = "|".join([os.path.abspath(model_path), str(stat.st_size), str(int(stat.st_mtime)),
+                        onnxruntime.__version__, self.optimization_level, ",".join(self.providers),
+                        platform.machine()])
+        digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+        name = os.path.splitext(os.path.basename(model_path))[0]
+        return os.path.join(self.optimized_cache_dir, f"{name}-{digest}.opt.onnx")
+
+    def create_session(self, model_path):
+        so = self.session_options()
+        if not self.optimized_cache_dir or self.optimization_level == 'disable':
+            return model_zoo.PickableInferenceSession(model_path, sess_options=so, providers=self.providers)
+        cached = self.optimized_path(model_path)
+        if os.path.exists(cached):
+            # El grafo ya está optimizado: no repetir el trabajo al crear la sesión
+            so.graph_optimization_level = OPTIMIZATION_LEVELS['disable']
+            return model_zoo.PickableInferenceSession(cached, sess_options=so, providers=self.providers)
+        os.makedirs(self.optimized_cache_dir, exist_ok=True)
+        tmp_path = f"{cached}.{os.getpid()}.tmp"
+        so.optimized_model_filepath = tmp_path
+        session = model_zoo.PickableInferenceSession(model_path, sess_options=so, providers=self.providers)
+        if os.path.exists(tmp_path):
+            os.replace(tmp_path, cached)
+        return session
+
+
+def load_model(model_path, config=None, session_path=None):
+    """
+    Carga un modelo ONNX de insightface (detección, reconocimiento, swapper...) con la SessionConfig dada.
+    session_path permite crear la sesión desde otra variante del modelo (por ejemplo INT8) mientras
+    insightface sigue leyendo del original los datos que necesita (emap del swapper, normalización).
+    """
+    if not os.path.isfile(model_path):
+        raise RuntimeError(f"No se encontró el modelo {model_path}")
+    config = config or SessionConfig()
+    session = config.create_session(session_path or model_path)
+    inputs = session.get_inputs()
+    input_shape = inputs[0].shape
+    # Misma selección de clase que insightface.model_zoo.ModelRouter
+    if len(session.get_outputs()) >= 5:
+        return RetinaFace(model_file=model_path, session=session)
+    elif input_shape[2] == 192 and input_shape[3] == 192:
+        return Landmark(model_file=model_path, session=session)
+    elif input_shape[2] == 96 and input_shape[3] == 96:
+        return Attribute(model_file=model_path, session=session)
+    elif len(inputs) == 2 and input_shape[2] == 128 and input_shape[3] == 128:
+        return INSwapper(model_file=model_path, session=session)
+    elif input_shape[2] == input_shape[3] and input_shape[2] >= 112 and input_shape[2] % 16 == 0:
+        return ArcFaceONNX(model_file=model_path, session=session)
+    return None
+
+
+# Tarea de cada modelo del pack buffalo_l: permite descartar los módulos no deseados sin crear su sesión.
+KNOWN_TASKS = {
+    'det_10g.onnx': 'detection',
+    'w600k_r50.onnx': 'recognition',
+    '1k3d68.onnx': 'landmark_3d_68',
+    '2d106det.onnx': 'landmark_2d_106',
+    'genderage.onnx': 'genderage',
+}
+
+
+class TunedFaceAnalysis(FaceAnalysis):
+    """
+    FaceAnalysis que crea las sesiones de cada modelo con la SessionConfig indicada.
+    Los modelos conocidos que no están en allowed_modules no se llegan a cargar.
+    """
+    def __init__(self, name='buffalo_l', root='~/.insightface', allowed_modules=None, config=None):
+        onnxruntime.set_default_logger_severity(3)
+        self.models = {}
+        self.model_dir = ensure_available('models', name, root=root)
+        for onnx_file in sorted(glob.glob(os.path.join(self.model_dir, '*.onnx'))):
+            known_task = KNOWN_TASKS.get(os.path.basename(onnx_file))
+            if allowed_modules is not None and known_task is not None and known_task not in allowed_modules:
+                continue
+            model = load_model(onnx_file, config)
+            if model is None or model.taskname in self.models:
+                continue
+            if allowed_modules is not None and model.taskname not in allowed_modules:
+                continue
+            self.models[model.taskname] = model
+        if 'detection' not in self.models:
+            raise RuntimeError(f"No se encontró un modelo de detección en {self.model_dir}")
+        self.det_model = self.models['detection']
+
+    def get(self, img, max_num=0, det_size=None):
+        """Como FaceAnalysis.get, pero det_size permite elegir el tamaño de entrada del detector por imagen."""
+        bboxes, kpss = self.det_model.detect(img, input_size=det_size, max_num=max_num, metric='default')
+        faces = []
+        for i in range(bboxes.shape[0]):
+            face = Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+            for taskname, model in self.models.items():
+                if taskname != 'detection':
+                    model.get(img, face)
+            faces.append(face)
+        return faces
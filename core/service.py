@@ -0,0 +1,278 @@
+import asyncio
+import base64
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from core.face_cache import content_hash
+
+MAX_BODY_BYTES = 64 * 2 ** 20
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+           422: 'Unprocessable Entity', 503: 'Service Unavailable'}
+
+
+class ServiceMetrics:
+    """Contadores del servicio y latencias de los últimos `window` trabajos completados."""
+    def __init__(self, window=2048):
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.completed = 0
+        self.errors = 0
+        self.rejected = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.latencies = deque(maxlen=window)
+
+    def snapshot(self, queue_depth, queue_capacity):
+        uptime = time.perf_counter() - self.started
+        latency = {}
+        if self.latencies:
+            values = np.array(self.latencies) * 1000.0
+            latency = {f"p{q}": round(float(np.percentile(values, q)), 2) for q in (50, 90, 99)}
+        return {
+            'uptime_s': round(uptime, 1),
+            'requests': self.requests,
+            'completed': self.completed,
+            'errors': self.errors,
+            'rejected': self.rejected,
+            'queue_depth': queue_depth,
+            'queue_capacity': queue_capacity,
+            'batches': self.batches,
+            'mean_batch_size': round(self.batched_requests / self.batches, 2) if self.batches else 0.0,
+            'latency_ms': latency,
+            'throughput_rps': round(self.completed / uptime, 3) if uptime > 0 else 0.0,
+        }
+
+
+class _Request:
+    def __init__(self, target, target_name, source, source_name, output, future, record):
+        self.target = target
+        self.target_name = target_name
+        self.source = source
+        self.source_name = source_name
+        self.output = output
+        self.future = future
+        self.record = record
+        self.admitted_at = time.perf_counter()
+
+
+class SwapService:
+    """
+    Servicio local (HTTP sobre TCP o socket Unix) que mantiene un único FaceSwapper cargado.
+    Las peticiones se aceptan de forma concurrente con asyncio y entran en una cola acotada
+    (si está llena se responde 503). Un bucle agrupa las pendientes en micro-lotes dentro de una
+    ventana de latencia y los ejecuta en un hilo de inferencia: detección por imagen y una única
+    pasada por lotes del swapper para todas las caras que comparten fuente. La codificación y la
+    escritura (con el OutputWriter del swapper) van al pool de E/S, en paralelo con el siguiente lote.
+    Cada petición deja un JobRecord 'service_swap' en la instrumentación del swapper.
+
+    POST /swap   {"target": ruta | "target_b64": ..., "source": ruta | "source_b64": ..., "output": ruta opcional}
+    GET  /metrics
+    GET  /health
+    """
+    def __init__(self, swapper, max_queue=64, batch_window_ms=10, max_batch=8):
+        self.swapper = swapper
+        self.max_queue = max_queue
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch = max_batch
+        self.metrics = ServiceMetrics()
+        self.queue = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='swap-inference')
+        self._io = ThreadPoolExecutor(max_workers=4, thread_name_prefix='swap-io')
+        self._finishing = set()
+
+    async def serve(self, host='127.0.0.1', port=8765, unix_path=None):
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        batcher = asyncio.create_task(self._batcher())
+        if unix_path:
+            server = await asyncio.start_unix_server(self._handle, path=unix_path)
+        else:
+            server = await asyncio.start_server(self._handle, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self._executor.shutdown(wait=False)
+            self._io.shutdown(wait=False)
+
+    async def submit(self, payload):
+        """Admite una petición de swap y espera su resultado."""
+        loop = asyncio.get_running_loop()
+        target, target_name = await loop.run_in_executor(self._io, _payload_image, payload, 'target')
+        source, source_name = await loop.run_in_executor(self._io, _payload_image, payload, 'source')
+        record = self.swapper.instrumentation.start('service_swap', target=target_name, source=source_name)
+        record.enter('queue')
+        request = _Request(target, target_name, source, source_name, payload.get('output'), loop.create_future(),
+                           record)
+        self.queue.put_nowait(request)
+        self.metrics.requests += 1
+        result = await request.future
+        latency = time.perf_counter() - request.admitted_at
+        self.metrics.latencies.append(latency)
+        result['latency_ms'] = round(latency * 1000, 2)
+        return result
+
+    async def _batcher(self):
+        from core.face_swapper import SwapCancelled
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Si el cliente se desconectó, su submit se canceló y con él request.future: no se procesa
+            for request in batch:
+                if request.future.done():
+                    self.swapper.instrumentation.end(request.record, error=SwapCancelled("Cliente desconectado"))
+            batch = [request for request in batch if not request.future.done()]
+            if not batch:
+                continue
+            self.metrics.batches += 1
+            self.metrics.batched_requests += len(batch)
+            results = await loop.run_in_executor(self._executor, self._run_batch, batch)
+            for request, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    self.metrics.errors += 1
+                    self.swapper.instrumentation.end(request.record, error=result)
+                    if not request.future.done():
+                        request.future.set_exception(result)
+                else:
+                    # El siguiente lote no espera a que se codifique y escriba este resultado
+                    task = asyncio.create_task(self._finish(request, *result))
+                    self._finishing.add(task)
+                    task.add_done_callback(self._finishing.discard)
+
+    async def _finish(self, request, img, faces):
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._io, self._encode_result, request, img, faces)
+        except Exception as e:
+            self.metrics.errors += 1
+            if not request.future.done():
+                request.future.set_exception(e)
+        else:
+            self.metrics.completed += 1
+            if not request.future.done():
+                request.future.set_result(result)
+
+    def _run_batch(self, batch):
+        """
+        Detecta cada objetivo y agrupa por fuente para pasar todas sus caras en un mismo lote.
+        Devuelve por petición (array resultado, número de caras) o la excepción que la hizo fallar.
+        """
+        results = [None] * len(batch)
+        groups = {}
+        for i, request in enumerate(batch):
+            record = request.record
+            try:
+                record.enter('detect_target')
+                img, faces = self.swapper.analyze_bytes(request.target, request.target_name)
+                record.set(width=img.shape[1], height=img.shape[0], faces=len(faces))
+                if len(faces) == 0:
+                    raise RuntimeError(f"No se detectaron caras en {request.target_name}")
+                record.enter('detect_source')
+                key = content_hash(request.source)
+                if key not in groups:
+                    groups[key] = (self.swapper.source_face_from_bytes(request.source, request.source_name), [])
+                groups[key][1].append((i, img, faces))
+            except Exception as e:
+                results[i] = e
+        for source_face, entries in groups.values():
+            for i, _, _ in entries:
+                batch[i].record.enter('swap')
+            try:
+                self.swapper.swap_frames([(img, faces) for _, img, faces in entries], source_face)
+            except Exception as e:
+                for i, _, _ in entries:
+                    results[i] = e
+                continue
+            for i, img, faces in entries:
+                results[i] = (img, len(faces))
+        return results
+
+    def _encode_result(self, request, img, faces):
+        """Codifica y, si se pidió una salida, la escribe de forma atómica con el OutputWriter del swapper."""
+        writer = self.swapper.output_writer
+        record = request.record
+        result = {'faces': faces}
+        try:
+            record.enter('encode')
+            path = writer.resolve_path(request.output or 'resultado.png')
+            data = writer.encode(img, path)
+            record.set(output_bytes=len(data))
+            if request.output:
+                record.enter('write')
+                writer.write(path, data)
+                result['output'] = path
+            else:
+                result['image_b64'] = base64.b64encode(data).decode('ascii')
+        except Exception as e:
+            self.swapper.instrumentation.end(record, error=e)
+            raise
+        self.swapper.instrumentation.end(record)
+        return result
+
+    async def _handle(self, reader, writer):
+        try:
+            status, payload = await self._dispatch(reader)
+        except Exception as e:
+            status, payload = 400, {'error': str(e)}
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _dispatch(self, reader):
+        method, path, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, value = line.decode('latin-1').split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        if length > MAX_BODY_BYTES:
+            return 413, {'error': "Petición demasiado grande"}
+        body = await reader.readexactly(length) if length else b''
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok'}
+        if method == 'GET' and path == '/metrics':
+            return 200, self.metrics.snapshot(self.queue.qsize(), self.max_queue)
+        if method == 'POST' and path == '/swap':
+            try:
+                return 200, await self.submit(json.loads(body or b'{}'))
+            except asyncio.QueueFull:
+                self.metrics.rejected += 1
+                return 503, {'error': "Cola llena, reintenta más tarde"}
+            except (KeyError, ValueError) as e:
+                return 400, {'error': str(e)}
+            except RuntimeError as e:
+                return 422, {'error': str(e)}
+        return 404, {'error': f"Ruta desconocida: {method} {path}"}
+
+
+def _payload_image(payload, field):
+    """Bytes codificados de la imagen `field`, indicada como ruta local o en base64."""
+    if payload.get(f"{field}_b64"):
+        return base64.b64decode(payload[f"{field}_b64"]), field
+    path = payload.get(field)
+    if not path:
+        raise KeyError(f"Falta '{field}' o '{field}_b64'")
+    with open(path, 'rb') as f:
+        return f.read(), path
+
@@ -0,0 +1,103 @@
+import base64
+import http.client
+import json
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, unix_path, timeout):
+        super().__init__('localhost', timeout=timeout)
+        self.unix_path = unix_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class SwapClient:
+    """Cliente del servicio local de core.service (TCP o socket Unix)."""
+    def __init__(self, host='127.0.0.1', port=8765, unix_path=None, timeout=300):
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.timeout = timeout
+
+    def _connection(self):
+        if self.unix_path:
+            return _UnixHTTPConnection(self.unix_path, self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, payload=None):
+        conn = self._connection()
+        try:
+            body = json.dumps(payload).encode('utf-8') if payload is not None else None
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            return response.status, json.loads(response.read() or b'{}')
+        finally:
+            conn.close()
+
+    def swap(self, target, source, output=None, inline=False):
+        """
+        Pide un swap. Con inline=True las imágenes viajan en base64 en lugar de como rutas locales.
+        Sin output, el resultado se devuelve en base64 en 'image_b64'.
+        """
+        payload = {}
+        for field, path in (('target', target), ('source', source)):
+            if inline:
+                with open(path, 'rb') as f:
+                    payload[f"{field}_b64"] = base64.b64encode(f.read()).decode('ascii')
+            else:
+                payload[field] = path
+        if output:
+            payload['output'] = output
+        status, result = self.request('POST', '/swap', payload)
+        if status != 200:
+            raise RuntimeError(f"HTTP {status}: {result.get('error', '')}")
+        return result
+
+    def metrics(self):
+        return self.request('GET', '/metrics')[1]
+
+
+def run_load(client, source, targets, requests=100, concurrency=8, inline=False, output_dir=None):
+    """
+    Generador de carga: lanza `requests` swaps con `concurrency` peticiones simultáneas repartidas
+    entre los objetivos y devuelve throughput, errores y latencias p50/p90/p99 vistas por el cliente.
+    """
+    def one(i):
+        target = targets[i % len(targets)]
+        output = os.path.join(output_dir, f"load_{i}.png") if output_dir else None
+        t0 = time.perf_counter()
+        try:
+            client.swap(target, source, output=output, inline=inline)
+            return time.perf_counter() - t0, None
+        except Exception as e:
+            return time.perf_counter() - t0, str(e)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - start
+    latencies = np.array([latency for latency, error in results if error is None]) * 1000.0
+    errors = [error for _, error in results if error is not None]
+    report = {
+        'requests': requests,
+        'concurrency': concurrency,
+        'ok': len(latencies),
+        'errors': len(errors),
+        'wall_s': round(wall, 3),
+        'throughput_rps': round(len(latencies) / wall, 3) if wall > 0 else 0.0,
+        'latency_ms': {f"p{q}": round(float(np.percentile(latencies, q)), 2) for q in (50, 90, 99)}
+        if len(latencies) else {},
+    }
+    if errors:
+        report['first_errors'] = errors[:5]
+    return report
@@ -0,0 +1,262 @@
+import multiprocessing as mp
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+
+class SharedFrameRing:
+    """
+    Anillo de `slots` frames de tamaño fijo en un bloque de multiprocessing.shared_memory.
+    Cada proceso se engancha por nombre y ve los slots como arrays numpy sobre la misma memoria,
+    así que entre procesos solo viajan índices de slot.
+    """
+    def __init__(self, slots, shape, name=None):
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.frame_bytes = int(np.prod(self.shape))
+        self._owner = name is None
+        if self._owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * self.frame_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def spec(self):
+        """Lo necesario para engancharse desde otro proceso."""
+        return self.slots, self.shape, self.name
+
+    def close(self):
+        del self.frames
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+
+def _decoder(video_path, ring_spec, free, ready, workers, max_frames, errors):
+    """Proceso decodificador: espera un slot libre (contrapresión), decodifica en él y publica su índice."""
+    ring = SharedFrameRing(*ring_spec)
+    cap = cv2.VideoCapture(video_path)
+    seq = 0
+    stalled = 0.0
+    target = frame = None
+    try:
+        while max_frames is None or seq < max_frames:
+            t0 = time.perf_counter()
+            slot = free.get()
+            stalled += time.perf_counter() - t0
+            if slot is None:
+                break
+            target = ring.frames[slot]
+            ok, frame = cap.read(target)
+            if not ok:
+                free.put(slot)
+                break
+            if frame.shape != target.shape:
+                raise RuntimeError(f"El frame {seq} mide {frame.shape[1]}x{frame.shape[0]}; "
+                                   f"se esperaba {target.shape[1]}x{target.shape[0]}")
+            if frame.ctypes.data != target.ctypes.data:
+                target[:] = frame
+            ready.put((seq, slot))
+            seq += 1
+    except Exception as e:
+        errors.put(('decode', str(e)))
+    finally:
+        cap.release()
+        for _ in range(workers):
+            ready.put(None)
+        errors.put(('decode_done', {'frames': seq, 'stalled_seconds': round(stalled, 4)}))
+        # Las vistas sobre el slot deben soltarse antes de cerrar la memoria compartida
+        target = frame = None
+        ring.close()
+
+
+def _worker(worker_id, swapper_kwargs, threads, source_path, ring_spec, ready, done):
+    """Proceso de inferencia: carga los modelos una vez y procesa en el sitio los frames que le llegan."""
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    cv2.setNumThreads(1)
+    ring = SharedFrameRing(*ring_spec)
+    try:
+        from core.face_swapper import FaceSwapper
+        swapper_kwargs = dict(swapper_kwargs)
+        config = swapper_kwargs.get('session_config')
+        if config is not None:
+            config.intra_op_threads, config.inter_op_threads = threads, 1
+        else:
+            swapper_kwargs['num_threads'] = threads
+        swapper = FaceSwapper(**swapper_kwargs)
+        source_face = swapper.source_face(source_path)
+    except Exception as e:
+        done.put(('error', worker_id, f"No se pudo iniciar el worker {worker_id}: {e}"))
+        ring.close()
+        return
+    done.put(('ready', worker_id, None))
+    busy = 0.0
+    frames = 0
+    frame = None
+    try:
+        while True:
+            item = ready.get()
+            if item is None:
+                break
+            seq, slot = item
+            t0 = time.perf_counter()
+            frame = ring.frames[slot]
+            swapper.swap_frame(frame, swapper.detect(frame), source_face)
+            frame = None
+            busy += time.perf_counter() - t0
+            frames += 1
+            done.put(('frame', seq, slot))
+    except Exception as e:
+        done.put(('error', worker_id, str(e)))
+    finally:
+        done.put(('worker_done', worker_id, {'frames': frames, 'busy_seconds': round(busy, 4)}))
+        frame = None
+        ring.close()
+
+
+def process_video_multiprocess(swapper_kwargs, source_img_path, video_path, output_path, workers=2,
+                               threads_per_worker=1, slots=None, fourcc='mp4v', progress=None,
+                               max_frames=None):
+    """
+    Variante multiproceso de core.video.process_video sin GIL compartido ni copias entre procesos:
+    un proceso decodificador escribe cada frame en un slot libre de un SharedFrameRing, `workers`
+    procesos detectan e intercambian las caras en el sitio sobre ese mismo slot, y este proceso
+    reordena por número de frame, lo codifica y devuelve el slot al anillo. Por las colas solo viajan
+    (frame, slot). El número de slots acota la memoria: si todos están ocupados, el decodificador
+    espera. Cada worker carga sus modelos (FaceSwapper(**swapper_kwargs)) con threads_per_worker hilos.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"No se pudo abrir el vídeo {video_path}")
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+    cap.release()
+    if max_frames is not None and total is not None:
+        total = min(total, max_frames)
+
+    # Hijos con 'spawn': no heredan hilos ni sesiones de ONNX Runtime del proceso padre
+    ctx = mp.get_context('spawn')
+    ring = SharedFrameRing(slots or 4 * workers, (height, width, 3))
+    free, ready, done, errors = ctx.Queue(), ctx.Queue(), ctx.Queue(), ctx.Queue()
+    processes = [ctx.Process(target=_worker, name=f'swap-worker-{i}', daemon=True,
+                             args=(i, swapper_kwargs, threads_per_worker, source_img_path, ring.spec(), ready, done))
+                 for i in range(workers)]
+    for p in processes:
+        p.start()
+    writer = None
+    pending = {}
+    next_seq = 0
+    reorder_max = 0
+    encode_seconds = 0.0
+    worker_stats = {}
+    try:
+        # Esperar a que todos los workers tengan los modelos cargados para medir solo el procesado
+        for _ in range(workers):
+            kind, _, message = _get(done, processes)
+            if kind == 'error':
+                raise RuntimeError(message)
+        for slot in range(ring.slots):
+            free.put(slot)
+        decoder = ctx.Process(target=_decoder, name='video-decoder', daemon=True,
+                              args=(video_path, ring.spec(), free, ready, workers, max_frames, errors))
+        start = time.perf_counter()
+        decoder.start()
+        processes.append(decoder)
+        finished = 0
+        while finished < workers:
+            kind, key, value = _get(done, processes)
+            if kind == 'error':
+                raise RuntimeError(value)
+            if kind == 'worker_done':
+                worker_stats[f"worker_{key}"] = value
+                finished += 1
+                continue
+            pending[key] = value
+            reorder_max = max(reorder_max, len(pending))
+            # Reensamblado en orden: se escriben todos los frames consecutivos disponibles
+            while next_seq in pending:
+                slot = pending.pop(next_seq)
+                t0 = time.perf_counter()
+                if writer is None:
+                    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+                    if not writer.isOpened():
+                        raise RuntimeError(f"No se pudo crear el vídeo de salida {output_path}")
+                writer.write(ring.frames[slot])
+                encode_seconds += time.perf_counter() - t0
+                free.put(slot)
+                next_seq += 1
+                if progress is not None:
+                    progress(next_seq, total)
+        wall = time.perf_counter() - start
+        kind, decode_stats = _get(errors, processes)
+        if kind == 'decode':
+            raise RuntimeError(decode_stats)
+        decoder.join()
+    finally:
+        if writer is not None:
+            writer.release()
+        for p in processes:
+            if p.is_alive():
+                p.terminate()
+            p.join()
+        ring.close()
+
+    return {
+        'frames': next_seq,
+        'workers': workers,
+        'threads_per_worker': threads_per_worker,
+        'slots': ring.slots,
+        'wall_seconds': round(wall, 4),
+        'fps': round(next_seq / wall, 3) if wall > 0 else 0.0,
+        'decode': decode_stats,
+        'encode_seconds': round(encode_seconds, 4),
+        'reorder_max': reorder_max,
+        'per_worker': worker_stats,
+    }
+
+
+def _get(q, processes):
+    """q.get() que no se queda bloqueado para siempre si algún proceso del pipeline muere sin avisar."""
+    while True:
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            dead = [p.name for p in processes if p.exitcode not in (None, 0)]
+            if dead:
+                raise RuntimeError(f"Terminaron inesperadamente: {', '.join(dead)}")
+
+
+def scaling_report(swapper_kwargs, source_img_path, video_path, output_path, worker_counts=(1, 2, 4),
+                   threads_per_worker=1, max_frames=None):
+    """
+    Ejecuta process_video_multiprocess con cada número de workers y devuelve fps, aceleración
+    respecto al primero y eficiencia (aceleración / workers relativos) de cada ejecución.
+    """
+    runs = []
+    base = None
+    for count in worker_counts:
+        stats = process_video_multiprocess(swapper_kwargs, source_img_path, video_path, output_path,
+                                           workers=count, threads_per_worker=threads_per_worker,
+                                           max_frames=max_frames)
+        if base is None:
+            base = (count, stats['fps'])
+        speedup = stats['fps'] / base[1] if base[1] else 0.0
+        runs.append({
+            'workers': count,
+            'fps': stats['fps'],
+            'speedup': round(speedup, 3),
+            'efficiency': round(speedup / (count / base[0]), 3),
+            'decoder_stalled_seconds': stats['decode'].get('stalled_seconds'),
+            'reorder_max': stats['reorder_max'],
+        })
+    return {'video': video_path, 'threads_per_worker': threads_per_worker, 'runs': runs}
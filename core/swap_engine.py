@@ -0,0 +1,147 @@
+import math
+
+import cv2
+import numpy as np
+from insightface.utils import face_align
+
+
+class BatchedSwapper:
+    """
+    Motor de inferencia por lotes sobre el modelo INSwapper de insightface.
+    Alinea los recortes de todas las caras (de una imagen o de varios frames), los pasa al modelo en
+    un único session.run por lote con el vector latente de la fuente calculado una sola vez, y pega
+    cada resultado en el sitio tocando solo la región de la cara en lugar de la imagen completa.
+    Si el modelo tiene el tamaño de lote fijo a 1, se hace una llamada por recorte.
+    """
+    def __init__(self, model, max_batch=16):
+        self.model = model
+        self.session = model.session
+        self.input_names = model.input_names
+        self.output_names = model.output_names
+        self.input_size = tuple(model.input_size)
+        batch_dim = self.session.get_inputs()[0].shape[0]
+        self.dynamic_batch = not isinstance(batch_dim, int)
+        self.max_batch = max(1, max_batch) if self.dynamic_batch else 1
+        # (cara fuente, latente): una sola tupla que se sustituye de una vez, porque el motor lo comparten
+        # varios hilos (inferencia del servicio, worker de la interfaz, calentamiento)
+        self._cached_latent = (None, None)
+
+    def latent(self, source_face):
+        """Vector latente de la cara fuente (se reutiliza mientras la fuente sea la misma)."""
+        cached_source, cached = self._cached_latent
+        if cached_source is source_face:
+            return cached
+        latent = source_face.normed_embedding.reshape((1, -1))
+        latent = np.dot(latent, self.model.emap)
+        latent /= np.linalg.norm(latent)
+        latent = latent.astype(np.float32)
+        self._cached_latent = (source_face, latent)
+        return latent
+
+    def align(self, img, face):
+        """
+        Igual que face_align.norm_crop2, pero el warp solo lee la región de img que cubre el recorte
+        alineado: img puede ser un memmap o una vista no contigua de una imagen enorme.
+        """
+        size = self.input_size[0]
+        M = face_align.estimate_norm(face.kps, size)
+        x0, y0, x1, y1 = _source_region(M, size, img.shape[1], img.shape[0], margin=2)
+        if x1 <= x0 or y1 <= y0:
+            return np.zeros((size, size, 3), dtype=np.uint8), M
+        crop = np.ascontiguousarray(img[y0:y1, x0:x1])
+        M_crop = M.copy()
+        M_crop[:, 2] += M[:, :2] @ np.array([x0, y0], dtype=M.dtype)
+        return cv2.warpAffine(crop, M_crop, (size, size), borderValue=0.0), M
+
+    def to_blob(self, crops):
+        """Tensor NCHW normalizado de una lista de recortes alineados."""
+        mean = self.model.input_mean
+        return cv2.dnn.blobFromImages(crops, 1.0 / self.model.input_std, self.input_size,
+                                      (mean, mean, mean), swapRB=True)
+
+    def infer(self, crops, latent):
+        """Devuelve los recortes BGR generados para una lista de recortes alineados."""
+        if not crops:
+            return []
+        blob = self.to_blob(crops)
+        fakes = []
+        for start in range(0, len(crops), self.max_batch):
+            chunk = blob[start:start + self.max_batch]
+            pred = self.session.run(self.output_names, {
+                self.input_names[0]: chunk,
+                self.input_names[1]: np.repeat(latent, len(chunk), axis=0),
+            })[0]
+            fake = np.clip(255 * pred.transpose((0, 2, 3, 1)), 0, 255).astype(np.uint8)[..., ::-1]
+            fakes.extend(fake)
+        return fakes
+
+    def paste(self, img, fake, aimg, M):
+        """
+        Composita un recorte generado en img (en el sitio) con la misma máscara erosionada y
+        suavizada que INSwapper.get, pero calculada solo en la región que ocupa la cara.
+        """
+        h, w = img.shape[:2]
+        size = aimg.shape[0]
+        IM = cv2.invertAffineTransform(M)
+        corners = np.array([[0, 0], [size, 0], [0, size], [size, size]], dtype=np.float32)
+        pts = corners @ IM[:, :2].T + IM[:, 2]
+        # Margen para que el desenfoque de la máscara no se corte en el borde de la región
+        side = max(pts[:, 0].max() - pts[:, 0].min(), pts[:, 1].max() - pts[:, 1].min())
+        pad = max(int(side) // 20, 5) + 4
+        x0 = max(0, int(math.floor(pts[:, 0].min())) - pad)
+        y0 = max(0, int(math.floor(pts[:, 1].min())) - pad)
+        x1 = min(w, int(math.ceil(pts[:, 0].max())) + pad)
+        y1 = min(h, int(math.ceil(pts[:, 1].max())) + pad)
+        if x1 <= x0 or y1 <= y0:
+            return img
+        IM[:, 2] -= (x0, y0)
+        region = (x1 - x0, y1 - y0)
+        bgr_fake = cv2.warpAffine(fake, IM, region, borderValue=0.0)
+        mask = cv2.warpAffine(np.full((size, size), 255, dtype=np.float32), IM, region, borderValue=0.0)
+        mask[mask > 20] = 255
+        mask_h_inds, mask_w_inds = np.where(mask == 255)
+        if mask_h_inds.size == 0:
+            return img
+        mask_h = np.max(mask_h_inds) - np.min(mask_h_inds)
+        mask_w = np.max(mask_w_inds) - np.min(mask_w_inds)
+        mask_size = int(np.sqrt(mask_h * mask_w))
+        k = max(mask_size // 10, 10)
+        mask = cv2.erode(mask, np.ones((k, k), np.uint8), iterations=1)
+        k = max(mask_size // 20, 5)
+        mask = cv2.GaussianBlur(mask, (2 * k + 1, 2 * k + 1), 0)
+        mask /= 255
+        mask = mask[:, :, None]
+        roi = img[y0:y1, x0:x1]
+        roi[:] = (mask * bgr_fake + (1 - mask) * roi.astype(np.float32)).astype(np.uint8)
+        return img
+
+    def swap_many(self, items, source_face, on_pasted=None):
+        """
+        items: lista de (img, faces), de una imagen o de varios frames. Las imágenes se modifican
+        en el sitio y se devuelven en el mismo orden. on_pasted(i, n) se llama tras pegar cada cara.
+        """
+        latent = self.latent(source_face)
+        crops, refs = [], []
+        for index, (img, faces) in enumerate(items):
+            for face in faces:
+                aimg, M = self.align(img, face)
+                crops.append(aimg)
+                refs.append((index, M))
+        fakes = self.infer(crops, latent)
+        for i, ((index, M), aimg, fake) in enumerate(zip(refs, crops, fakes)):
+            self.paste(items[index][0], fake, aimg, M)
+            if on_pasted is not None:
+                on_pasted(i, len(fakes))
+        return [img for img, _ in items]
+
+
+def _source_region(M, size, width, height, margin=0):
+    """Rectángulo (x0, y0, x1, y1) de la imagen que la transformación inversa de M lleva al recorte size x size."""
+    IM = cv2.invertAffineTransform(M)
+    corners = np.array([[0, 0], [size, 0], [0, size], [size, size]], dtype=np.float64)
+    pts = corners @ IM[:, :2].T + IM[:, 2]
+    x0 = max(0, int(math.floor(pts[:, 0].min())) - margin)
+    y0 = max(0, int(math.floor(pts[:, 1].min())) - margin)
+    x1 = min(width, int(math.ceil(pts[:, 0].max())) + margin)
+    y1 = min(height, int(math.ceil(pts[:, 1].max())) + margin)
+    return x0, y0, x1, y1
@@ -0,0 +1,134 @@
+import itertools
+
+import cv2
+import numpy as np
+from insightface.app.common import Face
+
+
+def iou(a, b):
+    """Intersección sobre unión de dos cajas [x1, y1, x2, y2]."""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class _Track:
+    def __init__(self, track_id, bbox, kps, det_score, embedding):
+        self.track_id = track_id
+        self.bbox = bbox
+        self.kps = kps
+        self.det_score = det_score
+        self.embedding = embedding
+
+    def to_face(self):
+        face = Face(bbox=self.bbox.copy(), kps=self.kps.copy(), det_score=self.det_score)
+        face.track_id = self.track_id
+        if self.embedding is not None:
+            face.embedding = self.embedding
+        return face
+
+
+class FaceTracker:
+    """
+    Seguidor de caras para vídeo que evita ejecutar el detector en cada frame.
+    El detector SCRFD completo solo corre en keyframes (cada keyframe_interval frames) o cuando el
+    seguimiento deriva; entre keyframes los kps se propagan con flujo óptico Lucas-Kanade y la caja
+    se mueve con la transformación de similitud estimada a partir de ellos. En cada keyframe las
+    detecciones se emparejan por IoU con los tracks existentes, que conservan su id y su embedding;
+    el reconocimiento solo se calcula para caras nuevas.
+    """
+    def __init__(self, swapper, keyframe_interval=10, max_drift=0.08, iou_threshold=0.3):
+        """
+        keyframe_interval: frames entre detecciones completas.
+        max_drift: error máximo de ida y vuelta del flujo óptico, como fracción del ancho de la cara.
+        iou_threshold: IoU mínimo para considerar que una detección continúa un track.
+        """
+        self.det_model = swapper.app.det_model
+        self.rec_model = swapper.app.models.get('recognition')
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.max_drift = max_drift
+        self.iou_threshold = iou_threshold
+        self.tracks = []
+        self.frames = 0
+        self.detector_calls = 0
+        self.drift_redetections = 0
+        self._ids = itertools.count()
+        self._prev_gray = None
+        self._since_keyframe = 0
+
+    def update(self, frame):
+        """Devuelve las caras del frame (ordenadas por x) con kps listos para el swapper."""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.frames += 1
+        keyframe = not self.tracks or self._since_keyframe >= self.keyframe_interval
+        if not keyframe and not self._propagate(gray):
+            self.drift_redetections += 1
+            keyframe = True
+        if keyframe:
+            self._detect(frame)
+            self._since_keyframe = 0
+        self._since_keyframe += 1
+        self._prev_gray = gray
+        return sorted((t.to_face() for t in self.tracks), key=lambda x: x.bbox[0])
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'detector_calls': self.detector_calls,
+            'detector_calls_avoided': self.frames - self.detector_calls,
+            'drift_redetections': self.drift_redetections,
+            'active_tracks': len(self.tracks),
+        }
+
+    def _propagate(self, gray):
+        """Propaga los kps de todos los tracks; devuelve False si algún track deriva."""
+        old = np.concatenate([t.kps for t in self.tracks]).astype(np.float32).reshape(-1, 1, 2)
+        lk = dict(winSize=(21, 21), maxLevel=3,
+                  criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+        new, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, old, None, **lk)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self._prev_gray, new, None, **lk)
+        fb_error = np.linalg.norm((old - back).reshape(-1, 2), axis=1)
+        ok = (status.ravel() == 1) & (back_status.ravel() == 1)
+        new = new.reshape(-1, 5, 2)
+        fb_error = fb_error.reshape(-1, 5)
+        ok = ok.reshape(-1, 5)
+        for i, track in enumerate(self.tracks):
+            width = max(1.0, float(track.bbox[2] - track.bbox[0]))
+            if not ok[i].all() or fb_error[i].max() > self.max_drift * width:
+                return False
+            M, _ = cv2.estimateAffinePartial2D(track.kps.astype(np.float32), new[i])
+            if M is None:
+                return False
+            corners = np.array([[track.bbox[0], track.bbox[1]], [track.bbox[2], track.bbox[3]]], dtype=np.float32)
+            moved = cv2.transform(corners.reshape(-1, 1, 2), M).reshape(-1, 2)
+            track.bbox = np.array([moved[:, 0].min(), moved[:, 1].min(), moved[:, 0].max(), moved[:, 1].max()],
+                                  dtype=np.float32)
+            track.kps = new[i].copy()
+        return True
+
+    def _detect(self, frame):
+        self.detector_calls += 1
+        bboxes, kpss = self.det_model.detect(frame, max_num=0, metric='default')
+        previous = list(self.tracks)
+        self.tracks = []
+        for i in range(bboxes.shape[0]):
+            bbox = bboxes[i, 0:4].astype(np.float32)
+            kps = kpss[i].astype(np.float32)
+            det_score = float(bboxes[i, 4])
+            best, best_iou = None, self.iou_threshold
+            for track in previous:
+                overlap = iou(bbox, track.bbox)
+                if overlap >= best_iou:
+                    best, best_iou = track, overlap
+            if best is not None:
+                previous.remove(best)
+                best.bbox, best.kps, best.det_score = bbox, kps, det_score
+                self.tracks.append(best)
+                continue
+            embedding = None
+            if self.rec_model is not None:
+                face = Face(bbox=bbox, kps=kps, det_score=det_score)
+                embedding = self.rec_model.get(frame, face)
+            self.tracks.append(_Track(next(self._ids), bbox, kps, det_score, embedding))
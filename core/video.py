@@ -0,0 +1,188 @@
+import queue
+import threading
+import time
+
+import cv2
+
+_END = object()
+
+
+class _Stage:
+    """Etapa del pipeline: un hilo que consume de una cola acotada y produce en la siguiente."""
+    def __init__(self, name, out_queue):
+        self.name = name
+        self.out_queue = out_queue
+        self.busy_seconds = 0.0
+        self.items = 0
+        self.occupancy_sum = 0
+        self.occupancy_max = 0
+        self.samples = 0
+
+    def put(self, item, stop):
+        if self.out_queue is None:
+            return
+        size = self.out_queue.qsize()
+        self.occupancy_sum += size
+        self.occupancy_max = max(self.occupancy_max, size)
+        self.samples += 1
+        while not stop.is_set():
+            try:
+                self.out_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def report(self, wall):
+        stats = {
+            'items': self.items,
+            'busy_seconds': round(self.busy_seconds, 4),
+            'utilization': round(self.busy_seconds / wall, 3) if wall > 0 else 0.0,
+        }
+        if self.out_queue is not None:
+            stats['queue_capacity'] = self.out_queue.maxsize
+            stats['queue_mean'] = round(self.occupancy_sum / self.samples, 2) if self.samples else 0.0
+            stats['queue_max'] = self.occupancy_max
+        return stats
+
+
+def _get(in_queue, stop):
+    while not stop.is_set():
+        try:
+            return in_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _END
+
+
+def process_video(swapper, source_img_path, video_path, output_path, queue_size=8, fourcc='mp4v',
+                  progress=None, tracker=None, batch_frames=1):
+    """
+    Procesa un vídeo en cuatro etapas solapadas (decodificar -> detectar -> swap -> codificar),
+    cada una en su hilo y unidas por colas acotadas, de modo que la memoria no crece con la
+    duración del clip. Los frames se escriben en orden en un cv2.VideoWriter.
+    Devuelve fps sostenidos y, por etapa, tiempo ocupado y ocupación media/máxima de su cola de salida:
+    la etapa con utilización cercana a 1 y la cola de entrada llena es el cuello de botella.
+    Con un FaceTracker la etapa de detección solo ejecuta el detector en keyframes.
+    batch_frames > 1 agrupa las caras de varios frames ya detectados en un mismo lote del swapper.
+    """
+    locate = tracker.update if tracker is not None else swapper.detect
+    source_face = swapper.source_face(source_img_path)
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"No se pudo abrir el vídeo {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+
+    decoded = queue.Queue(maxsize=queue_size)
+    detected = queue.Queue(maxsize=queue_size)
+    swapped = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+    stages = {
+        'decode': _Stage('decode', decoded),
+        'detect': _Stage('detect', detected),
+        'swap': _Stage('swap', swapped),
+        'encode': _Stage('encode', None),
+    }
+
+    def run(stage, body):
+        try:
+            body(stage)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            stage.put(_END, stop)
+
+    def decode(stage):
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            ok, frame = cap.read()
+            if not ok:
+                break
+            stage.busy_seconds += time.perf_counter() - t0
+            stage.items += 1
+            stage.put(frame, stop)
+
+    def detect(stage):
+        while True:
+            frame = _get(decoded, stop)
+            if frame is _END:
+                break
+            t0 = time.perf_counter()
+            faces = locate(frame)
+            stage.busy_seconds += time.perf_counter() - t0
+            stage.items += 1
+            stage.put((frame, faces), stop)
+
+    def swap(stage):
+        finished = False
+        while not finished:
+            item = _get(detected, stop)
+            if item is _END:
+                break
+            # Completar el lote con los frames que ya estén esperando, sin bloquear
+            batch = [item]
+            while len(batch) < batch_frames:
+                try:
+                    item = detected.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _END:
+                    finished = True
+                    break
+                batch.append(item)
+            t0 = time.perf_counter()
+            frames = swapper.swap_frames(batch, source_face)
+            stage.busy_seconds += time.perf_counter() - t0
+            stage.items += len(frames)
+            for frame in frames:
+                stage.put(frame, stop)
+
+    threads = [
+        threading.Thread(target=run, args=(stages['decode'], decode), name='video-decode', daemon=True),
+        threading.Thread(target=run, args=(stages['detect'], detect), name='video-detect', daemon=True),
+        threading.Thread(target=run, args=(stages['swap'], swap), name='video-swap', daemon=True),
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+
+    writer = None
+    encode = stages['encode']
+    try:
+        while True:
+            frame = _get(swapped, stop)
+            if frame is _END:
+                break
+            t0 = time.perf_counter()
+            if writer is None:
+                h, w = frame.shape[:2]
+                writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*fourcc), fps, (w, h))
+                if not writer.isOpened():
+                    raise RuntimeError(f"No se pudo crear el vídeo de salida {output_path}")
+            writer.write(frame)
+            encode.busy_seconds += time.perf_counter() - t0
+            encode.items += 1
+            if progress is not None:
+                progress(encode.items, total)
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+        cap.release()
+        if writer is not None:
+            writer.release()
+    if errors:
+        raise errors[0]
+
+    wall = time.perf_counter() - start
+    stats = {
+        'frames': encode.items,
+        'wall_seconds': round(wall, 4),
+        'fps': round(encode.items / wall, 3) if wall > 0 else 0.0,
+        'stages': {name: stage.report(wall) for name, stage in stages.items()},
+    }
+    if tracker is not None:
+        stats['tracker'] = tracker.stats()
+    return stats
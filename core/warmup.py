@@ -0,0 +1,62 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+def warm_up(swapper, batch_sizes=None, repeats=1):
+    """
+    Ejecuta entradas vacías por todas las sesiones de `swapper` con cada forma que usará: el detector
+    con cada tamaño de swapper.det_sizes, los demás modelos de análisis con su entrada y el swapper
+    con cada tamaño de lote de batch_sizes (por defecto 1 y engine.max_batch: el lote mayor deja la
+    arena de ONNX Runtime con su tamaño máximo, y recorrer todos los tamaños alargaría el arranque
+    en CPU). ONNX Runtime reserva sus arenas y especializa los kernels en la primera ejecución de
+    cada forma; así eso ocurre aquí y no en el primer swap del usuario.
+    Devuelve el tiempo en ms de cada paso y el total.
+    """
+    stages = {}
+    start = time.perf_counter()
+
+    def timed(name, fn):
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+        stages[name] = round((time.perf_counter() - t0) * 1000, 3)
+
+    det_model = swapper.app.det_model
+    for det_size in swapper.det_sizes:
+        img = np.zeros((det_size[1], det_size[0], 3), dtype=np.uint8)
+        timed(f"detection_{det_size[0]}x{det_size[1]}",
+              lambda: det_model.detect(img, input_size=det_size, max_num=0, metric='default'))
+    for taskname, model in sorted(swapper.app.models.items()):
+        if taskname == 'detection':
+            continue
+        w, h = model.input_size
+        blob = np.zeros((1, 3, h, w), dtype=np.float32)
+        timed(taskname, lambda: model.session.run(model.output_names, {model.input_name: blob}))
+    engine = swapper.engine
+    size = engine.input_size
+    latent = np.zeros((1, swapper.swapper.emap.shape[1]), dtype=np.float32)
+    if batch_sizes is None:
+        batch_sizes = (1, engine.max_batch)
+    for batch in sorted({min(b, engine.max_batch) for b in batch_sizes}):
+        crops = [np.zeros((size[1], size[0], 3), dtype=np.uint8)] * batch
+        timed(f"swap_batch_{batch}", lambda: engine.infer(crops, latent))
+    return {'stages_ms': stages, 'total_ms': round((time.perf_counter() - start) * 1000, 3)}
+
+
+def warm_up_async(swapper, batch_sizes=None, repeats=1):
+    """warm_up en un hilo en segundo plano; devuelve un Future con el informe."""
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(warm_up(swapper, batch_sizes=batch_sizes, repeats=repeats))
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name='warm-up', daemon=True).start()
+    return future
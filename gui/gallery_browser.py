@@ -0,0 +1,80 @@
+import os
+from PyQt5.QtWidgets import (QDialog, QListWidget, QListWidgetItem, QVBoxLayout, QHBoxLayout, QPushButton,
+                             QListView, QLabel)
+from PyQt5.QtGui import QPixmap, QIcon
+from PyQt5.QtCore import Qt, QSize, QTimer, pyqtSignal
+
+
+class GalleryBrowser(QDialog):
+    """Navegador de la galería que lee miniaturas y caras del índice en lugar de abrir cada imagen."""
+    chosen = pyqtSignal(str, str, object)
+
+    # Miniaturas que se decodifican por vuelta del bucle de eventos
+    CHUNK = 64
+
+    def __init__(self, index, root, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Galería")
+        self.resize(820, 560)
+        self.index = index
+        self._pending = []
+
+        self.list = QListWidget()
+        self.list.setViewMode(QListView.IconMode)
+        self.list.setIconSize(QSize(128, 128))
+        self.list.setResizeMode(QListView.Adjust)
+        self.list.setUniformItemSizes(True)
+        self.list.setSpacing(6)
+        self.list.itemDoubleClicked.connect(lambda item: self.choose('target'))
+
+        self.info_label = QLabel("")
+        self.info_label.setStyleSheet("color: #7f8c8d;")
+        target_btn = QPushButton("Usar como objetivo")
+        source_btn = QPushButton("Usar como fuente")
+        close_btn = QPushButton("Cerrar")
+        target_btn.clicked.connect(lambda: self.choose('target'))
+        source_btn.clicked.connect(lambda: self.choose('source'))
+        close_btn.clicked.connect(self.close)
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.info_label, 1)
+        buttons.addWidget(target_btn)
+        buttons.addWidget(source_btn)
+        buttons.addWidget(close_btn)
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.list)
+        layout.addLayout(buttons)
+
+        entries = index.entries(root)
+        for path, face_count in entries:
+            item = QListWidgetItem(os.path.basename(path))
+            item.setData(Qt.UserRole, path)
+            caras = "caras sin detectar" if face_count is None else f"{face_count} caras"
+            item.setToolTip(f"{path}\n{caras}")
+            self.list.addItem(item)
+            self._pending.append(item)
+        self.info_label.setText(f"{len(entries)} imágenes")
+        QTimer.singleShot(0, self._load_thumbnails)
+
+    def _load_thumbnails(self):
+        """Carga las miniaturas por tandas para que el diálogo aparezca al instante."""
+        chunk, self._pending = self._pending[:self.CHUNK], self._pending[self.CHUNK:]
+        for item in chunk:
+            data = self.index.thumbnail(item.data(Qt.UserRole))
+            if data:
+                pixmap = QPixmap()
+                pixmap.loadFromData(data)
+                item.setIcon(QIcon(pixmap))
+        if self._pending:
+            QTimer.singleShot(0, self._load_thumbnails)
+
+    def choose(self, role):
+        item = self.list.currentItem()
+        if item is None:
+            return
+        path = item.data(Qt.UserRole)
+        pixmap = QPixmap()
+        data = self.index.thumbnail(path)
+        if data:
+            pixmap.loadFromData(data)
+        self.chosen.emit(role, path, pixmap)
@@ -0,0 +1,47 @@
+import numpy as np
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage, QPixmap
+
+# Format_BGR888 existe desde Qt 5.14; con versiones anteriores hay que convertir a RGB.
+_BGR888 = getattr(QImage, 'Format_BGR888', None)
+
+
+def read_image(path):
+    """
+    Decodifica una imagen del disco a un array BGR uint8 (una única vez). El mismo array sirve para
+    la vista previa y se pasa tal cual al FaceSwapper, que no lo modifica.
+    """
+    import cv2
+    img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise RuntimeError(f"No se pudo leer la imagen {path}")
+    return img
+
+
+def bgr_to_qimage(img):
+    """
+    Envuelve un array BGR uint8 en un QImage sin copiar los píxeles cuando las filas son contiguas.
+    El QImage no es dueño de la memoria: el array debe seguir vivo mientras se use (se guarda una
+    referencia en el propio QImage).
+    """
+    if img.strides[1:] != (3, 1):
+        img = np.ascontiguousarray(img)
+    h, w = img.shape[:2]
+    if _BGR888 is None:
+        import cv2
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        qimg = QImage(img.data, w, h, img.strides[0], QImage.Format_RGB888)
+    else:
+        qimg = QImage(img.data, w, h, img.strides[0], _BGR888)
+    qimg._buffer = img
+    return qimg
+
+
+def bgr_to_pixmap(img, width=None, height=None, smooth=True):
+    """QPixmap de un array BGR, escalado opcionalmente a width x height conservando la proporción."""
+    qimg = bgr_to_qimage(img)
+    if width is not None and height is not None:
+        mode = Qt.SmoothTransformation if smooth else Qt.FastTransformation
+        # Escalar el QImage antes de convertir evita subir a QPixmap la imagen completa
+        qimg = qimg.scaled(width, height, Qt.KeepAspectRatio, mode)
+    return QPixmap.fromImage(qimg)
@@ -1,103 +1,15 @@
 from PyQt5.QtWidgets import (QMainWindow, QPushButton, QLabel, QFileDialog, QVBoxLayout, 
-                         QHBoxLayout, QWidget, QMessageBox, QFrame, QProgressBar, QGroupBox, QGridLayout, QSizePolicy)
-from PyQt5.QtGui import QPixmap, QImage, QFont, QIcon, QWheelEvent, QPainter
+                         QHBoxLayout, QWidget, QMessageBox, QFrame, QProgressBar, QGroupBox, QGridLayout)
+from PyQt5.QtGui import QFont, QIcon
 from PyQt5.QtCore import Qt, QSize, QTimer
 import os
-import cv2
-from core.face_swapper import FaceSwapper
+from gui.workers import GalleryScanner, ModelLoader, SwapWorker
+from gui.gallery_browser import GalleryBrowser
+from gui.image_buffer import bgr_to_pixmap, bgr_to_qimage, read_image
+from gui.zoom_view import ZoomableLabel
 
-class ZoomableLabel(QLabel):
-    """QLabel que permite hacer zoom con la rueda del ratón (Ctrl + rueda) y mover la imagen con drag (pan)."""
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setAlignment(Qt.AlignCenter)
-        self.setStyleSheet("background-color: #ffffff;")
-        self.setMinimumSize(250, 250)
-        self._zoom = 1.0
-        self._max_zoom = 4.0
-        self._min_zoom = 0.2
-        self._base_pixmap = None
-        self._offset = [0, 0]  # Desplazamiento x, y
-        self._drag_active = False
-        self._last_pos = None
-
-    def setPixmap(self, pixmap):
-        self._base_pixmap = pixmap
-        self._zoom = 1.0
-        self._offset = [0, 0]
-        self.updatePixmap()
-
-    def updatePixmap(self):
-        if self._base_pixmap:
-            size = self._base_pixmap.size()
-            w = int(size.width() * self._zoom)
-            h = int(size.height() * self._zoom)
-            scaled = self._base_pixmap.scaled(w, h, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            # Crear un QPixmap del tamaño del label para centrar y desplazar
-            label_size = self.size()
-            canvas = QPixmap(label_size)
-            canvas.fill(Qt.white)
-            painter = QPainter(canvas)
-            # Calcular posición centrada + offset
-            x = (label_size.width() - scaled.width()) // 2 + self._offset[0]
-            y = (label_size.height() - scaled.height()) // 2 + self._offset[1]
-            painter.drawPixmap(x, y, scaled)
-            painter.end()
-            super().setPixmap(canvas)
-
-    def wheelEvent(self, event: QWheelEvent):
-        if event.modifiers() == Qt.ControlModifier:
-            angle = event.angleDelta().y()
-            factor = 1.25 if angle > 0 else 0.8
-            new_zoom = self._zoom * factor
-            if self._min_zoom <= new_zoom <= self._max_zoom:
-                # Mantener el punto bajo el cursor al hacer zoom
-                if self._base_pixmap:
-                    cursor_pos = event.pos()
-                    label_size = self.size()
-                    pixmap_size = self._base_pixmap.size() * self._zoom
-                    rel_x = cursor_pos.x() - label_size.width() // 2 - self._offset[0]
-                    rel_y = cursor_pos.y() - label_size.height() // 2 - self._offset[1]
-                    scale_factor = new_zoom / self._zoom
-                    self._offset[0] = int(self._offset[0] - rel_x * (scale_factor - 1))
-                    self._offset[1] = int(self._offset[1] - rel_y * (scale_factor - 1))
-                self._zoom = new_zoom
-                self.updatePixmap()
-            event.accept()
-        else:
-            super().wheelEvent(event)
-
-    def mousePressEvent(self, event):
-        if event.button() == Qt.LeftButton and self._zoom > 1.0:
-            self._drag_active = True
-            self._last_pos = event.pos()
-            self.setCursor(Qt.ClosedHandCursor)
-        super().mousePressEvent(event)
-
-    def mouseMoveEvent(self, event):
-        if self._drag_active and self._last_pos:
-            dx = event.pos().x() - self._last_pos.x()
-            dy = event.pos().y() - self._last_pos.y()
-            self._offset[0] += dx
-            self._offset[1] += dy
-            self._last_pos = event.pos()
-            self.updatePixmap()
-        super().mouseMoveEvent(event)
-
-    def mouseReleaseEvent(self, event):
-        if event.button() == Qt.LeftButton:
-            self._drag_active = False
-            self.setCursor(Qt.ArrowCursor)
-        super().mouseReleaseEvent(event)
-
-    def resizeEvent(self, event):
-        self.updatePixmap()
-        super().resizeEvent(event)
-
-    def resetZoom(self):
-        self._zoom = 1.0
-        self._offset = [0, 0]
-        self.updatePixmap()
+GALLERY_DIR = os.path.join("images", "gallery")
+GALLERY_INDEX_PATH = os.path.join("images", "gallery_index.sqlite")
 
 class ImageFrame(QFrame):
     """Frame personalizado para mostrar imágenes con un título y un borde estilizado"""
@@ -147,9 +59,12 @@ class ImageFrame(QFrame):
         self.layout.addWidget(self.image_label)
         self.layout.addWidget(self.info_label)
     
-    def setImage(self, pixmap):
-        if hasattr(self.image_label, 'setPixmap'):
-            self.image_label.setPixmap(pixmap)
+    def setImage(self, image):
+        """QPixmap ya escalado para los frames normales; QImage a resolución completa para los de zoom."""
+        if isinstance(self.image_label, ZoomableLabel):
+            self.image_label.setImage(image)
+        else:
+            self.image_label.setPixmap(image)
         self.info_label.setText("")
     
     def setInfo(self, text):
@@ -218,13 +133,23 @@ class MainWindow(QMainWindow):
             }
         """)
         
-        self.swapper = FaceSwapper()
+        # Los modelos se cargan en segundo plano para que la ventana aparezca al instante
+        self.swapper = None
+        self.swap_worker = None
+        self.gallery_index = None
+        self.gallery_scanner = None
         self.target_img_path = None
         self.source_img_path = None
+        self.target_img = None
+        self.source_img = None
         self.result_img = None
+        self.result_path = None
+        self.preview_job_id = None
+        self.selection_job_id = None
         
-        # Inicializar la interfaz después de un corto retraso
         self.init_ui()
+        self.start_model_loading()
+        self.start_gallery_scan()
     
    
     def init_ui(self):
@@ -282,6 +207,12 @@ class MainWindow(QMainWindow):
         self.reset_zoom_btn = StyledButton("Resetear zoom", reset_icon)
         self.reset_zoom_btn.setEnabled(False)
         self.reset_zoom_btn.clicked.connect(self.reset_result_zoom)
+        self.cancel_btn = StyledButton("Cancelar")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_swaps)
+        self.gallery_btn = StyledButton("Galería")
+        self.gallery_btn.setEnabled(False)
+        self.gallery_btn.clicked.connect(self.open_gallery)
         
         # Conectar señales
         self.target_btn.clicked.connect(self.select_target_img)
@@ -297,7 +228,9 @@ class MainWindow(QMainWindow):
         # Agregar botones al layout
         buttons_layout.addWidget(self.target_btn)
         buttons_layout.addWidget(self.source_btn)
+        buttons_layout.addWidget(self.gallery_btn)
         buttons_layout.addWidget(self.swap_btn)
+        buttons_layout.addWidget(self.cancel_btn)
         buttons_layout.addWidget(self.clear_btn)
         buttons_layout.addWidget(self.save_btn)
         buttons_layout.addWidget(self.reset_zoom_btn)
@@ -320,9 +253,19 @@ class MainWindow(QMainWindow):
             }
         """)
         
+        # Estado de carga de modelos y de la última operación
+        self.status_label = QLabel("")
+        self.status_label.setAlignment(Qt.AlignCenter)
+        self.status_label.setStyleSheet("color: #7f8c8d;")
+        self.stats_label = QLabel("")
+        self.stats_label.setAlignment(Qt.AlignCenter)
+        self.stats_label.setStyleSheet("color: #95a5a6; font-size: 11px;")
+        
         # Agregar todo al layout de controles
         controls_layout.addLayout(buttons_layout)
         controls_layout.addWidget(self.progress_bar)
+        controls_layout.addWidget(self.status_label)
+        controls_layout.addWidget(self.stats_label)
         
         # Pie de página / barra de estado
         footer_label = QLabel("© 2025 Deepfake - Face Swapper - UDEC | Desarrollado con ❤ & ☕")
@@ -341,6 +284,71 @@ class MainWindow(QMainWindow):
         
         self.setCentralWidget(central_widget)
         
+    def start_model_loading(self):
+        """Carga FaceSwapper en un hilo; el botón de swap se habilita al recibir la señal de listo."""
+        self.status_label.setText("Cargando y preparando modelos...")
+        self.model_loader = ModelLoader(parent=self)
+        self.model_loader.loaded.connect(self.on_models_loaded)
+        self.model_loader.failed.connect(self.on_models_failed)
+        self.model_loader.start()
+
+    def on_models_loaded(self, swapper, seconds, warm_report):
+        self.swapper = swapper
+        self.swap_worker = SwapWorker(swapper, parent=self)
+        self.swap_worker.progress.connect(self.on_swap_progress)
+        self.swap_worker.preview_ready.connect(self.on_swap_preview)
+        self.swap_worker.finished_job.connect(self.on_swap_finished)
+        self.swap_worker.failed.connect(self.on_swap_failed)
+        self.swap_worker.cancelled.connect(self.on_swap_cancelled)
+        self.swap_worker.queue_changed.connect(self.on_queue_changed)
+        self.swap_worker.job_stats.connect(self.on_job_stats)
+        self.swap_worker.start()
+        estado = f"Modelos listos ({seconds:.1f} s"
+        if 'total_ms' in warm_report:
+            estado += f", calentados en {warm_report['total_ms'] / 1000:.1f} s"
+        self.status_label.setText(estado + ")")
+        self.update_swap_button_state()
+        if self.gallery_index is not None:
+            swapper.gallery_index = self.gallery_index
+            self.start_gallery_scan()
+
+    def on_models_failed(self, message):
+        self.status_label.setText("Error al cargar los modelos")
+        QMessageBox.critical(self, "Error", f"No se pudieron cargar los modelos: {message}")
+
+    def start_gallery_scan(self):
+        """
+        Indexa images/gallery en segundo plano. Sin modelos solo actualiza miniaturas; con el
+        swapper cargado también detecta y guarda las caras de las imágenes nuevas o modificadas.
+        """
+        if not os.path.isdir(GALLERY_DIR):
+            return
+        self.gallery_scanner = GalleryScanner(GALLERY_DIR, GALLERY_INDEX_PATH, index=self.gallery_index,
+                                              swapper=self.swapper, parent=self)
+        self.gallery_scanner.indexed.connect(self.on_gallery_indexed)
+        self.gallery_scanner.progress.connect(self.stats_label.setText)
+        self.gallery_scanner.start()
+
+    def on_gallery_indexed(self, index, stats):
+        first_scan = self.gallery_index is None
+        self.gallery_index = index
+        self.gallery_btn.setEnabled(True)
+        self.stats_label.setText(f"Galería indexada: {stats['updated']} nuevas, {stats['unchanged']} sin cambios")
+        if first_scan and self.swapper is not None:
+            # Los modelos terminaron de cargar antes que las miniaturas: falta detectar las caras
+            self.swapper.gallery_index = index
+            self.start_gallery_scan()
+
+    def open_gallery(self):
+        browser = GalleryBrowser(self.gallery_index, GALLERY_DIR, parent=self)
+        browser.chosen.connect(self.on_gallery_chosen)
+        browser.show()
+
+    def on_gallery_chosen(self, role, path, pixmap):
+        if role == 'target':
+            self.set_target_image(path, pixmap)
+        else:
+            self.set_source_image(path, pixmap)
     
     def select_target_img(self):
         path, _ = QFileDialog.getOpenFileName(
@@ -348,12 +356,7 @@ class MainWindow(QMainWindow):
             "Imágenes (*.png *.jpg *.jpeg *.bmp)"
         )
         if path:
-            self.target_img_path = path
-            pixmap = QPixmap(path)
-            scaled_pixmap = pixmap.scaled(250, 250, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            self.target_frame.setImage(scaled_pixmap)
-            self.target_frame.setInfo(f"Archivo: {os.path.basename(path)}")
-            self.update_swap_button_state()
+            self.set_target_image(path)
 
     def select_source_img(self):
         path, _ = QFileDialog.getOpenFileName(
@@ -361,88 +364,162 @@ class MainWindow(QMainWindow):
             "Imágenes (*.png *.jpg *.jpeg *.bmp)"
         )
         if path:
-            self.source_img_path = path
-            pixmap = QPixmap(path)
-            scaled_pixmap = pixmap.scaled(250, 250, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            self.source_frame.setImage(scaled_pixmap)
-            self.source_frame.setInfo(f"Archivo: {os.path.basename(path)}")
-            self.update_swap_button_state()
+            self.set_source_image(path)
+
+    def _load_preview(self, path, pixmap=None):
+        """
+        Devuelve (array BGR o None, vista previa de 250x250). La imagen se decodifica una sola vez y
+        el mismo array se entrega al swapper; con la miniatura del índice no se decodifica nada y el
+        swapper leerá el archivo solo cuando haga falta.
+        """
+        if pixmap is not None and not pixmap.isNull():
+            return None, pixmap.scaled(250, 250, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        img = read_image(path)
+        return img, bgr_to_pixmap(img, 250, 250)
+
+    def set_target_image(self, path, pixmap=None):
+        try:
+            img, preview = self._load_preview(path, pixmap)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e))
+            return
+        self.target_img_path, self.target_img = path, img
+        self.cancel_refinement()
+        self.target_frame.setImage(preview)
+        self.target_frame.setInfo(f"Archivo: {os.path.basename(path)}")
+        self.update_swap_button_state()
+
+    def set_source_image(self, path, pixmap=None):
+        try:
+            img, preview = self._load_preview(path, pixmap)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e))
+            return
+        self.source_img_path, self.source_img = path, img
+        self.cancel_refinement()
+        self.source_frame.setImage(preview)
+        self.source_frame.setInfo(f"Archivo: {os.path.basename(path)}")
+        self.update_swap_button_state()
 
     def update_swap_button_state(self):
-        """Actualiza el estado del botón de swap basado en si ambas imágenes están cargadas"""
-        if self.target_img_path and self.source_img_path:
+        """Actualiza el estado del botón de swap basado en si ambas imágenes y los modelos están cargados"""
+        if self.target_img_path and self.source_img_path and self.swapper is not None:
             self.swap_btn.setEnabled(True)
         else:
             self.swap_btn.setEnabled(False)
             
     def do_swap(self):
+        """Encola el swap en el hilo de trabajo; se pueden encolar varios mientras se procesa otro."""
         if not self.target_img_path or not self.source_img_path:
             QMessageBox.warning(self, "Error", "Selecciona ambas imágenes primero.")
             return
-        try:
-            self.progress_bar.setVisible(True)
-            self.progress_bar.setValue(0)
-            self.target_btn.setEnabled(False)
-            self.source_btn.setEnabled(False)
-            self.swap_btn.setEnabled(False)
-            QTimer.singleShot(300, lambda: self.progress_bar.setValue(30))
-            QTimer.singleShot(600, lambda: self.progress_bar.setValue(60))
-            QTimer.singleShot(900, lambda: self.progress_bar.setValue(90))
-            # Nombre descriptivo para la imagen generada
-            nombre_objetivo = os.path.splitext(os.path.basename(self.target_img_path))[0]
-            nombre_fuente = os.path.splitext(os.path.basename(self.source_img_path))[0]
-            output_name = f"swap_{nombre_objetivo}_con_{nombre_fuente}.png"
-            output_path = os.path.join("images", "generated", output_name)
-            _, self.result_img = self.swapper.swap_faces(
-                self.target_img_path, 
-                self.source_img_path, 
-                output_path
-            )
-            QTimer.singleShot(1200, lambda: self.show_result(self.result_img))
-        except Exception as e:
-            self.progress_bar.setVisible(False)
-            self.target_btn.setEnabled(True)
-            self.source_btn.setEnabled(True)
-            self.swap_btn.setEnabled(True)
-            QMessageBox.critical(self, "Error", str(e))
-    
-    def show_result(self, img):
-        """Muestra la imagen resultado en el frame correspondiente, ocupando todo el ancho disponible sin distorsión y habilita zoom interactivo."""
-        # Convertimos a RGB y creamos el QPixmap
-        rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        h, w, ch = rgb_img.shape
-        bytes_per_line = ch * w
-        qimg = QImage(rgb_img.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(qimg)
+        if self.swap_worker is None:
+            QMessageBox.warning(self, "Error", "Los modelos aún se están cargando.")
+            return
+        # Nombre descriptivo para la imagen generada
+        nombre_objetivo = os.path.splitext(os.path.basename(self.target_img_path))[0]
+        nombre_fuente = os.path.splitext(os.path.basename(self.source_img_path))[0]
+        output_name = f"swap_{nombre_objetivo}_con_{nombre_fuente}.png"
+        output_path = os.path.join("images", "generated", output_name)
+        self.progress_bar.setVisible(True)
+        target = self.target_img if self.target_img is not None else self.target_img_path
+        source = self.source_img if self.source_img is not None else self.source_img_path
+        self.selection_job_id = self.swap_worker.enqueue(target, source, output_path,
+                                                         target_name=self.target_img_path,
+                                                         source_name=self.source_img_path, preview=True)
 
-        # Hacemos que el label expanda con el layout
-        self.result_frame.image_label.setSizePolicy(
-            QSizePolicy.Expanding,
-            QSizePolicy.Expanding
-        )
+    def cancel_swaps(self):
+        """Cancela el swap en curso y los que estén en cola."""
+        if self.swap_worker is not None:
+            self.swap_worker.cancel_all()
 
-        # Obtenemos el ancho y alto actualmente disponibles en el label
-        available_w = self.result_frame.image_label.width()
-        available_h = self.result_frame.image_label.height()
+    def cancel_refinement(self):
+        """
+        Al cambiar la fuente o el objetivo, el último swap pedido para la selección anterior ya no
+        interesa aunque aún no tenga vista previa (o no vaya a tenerla), ni el de la vista previa que se
+        está mostrando: se cancelan. Los demás swaps en cola siguen adelante.
+        """
+        if self.swap_worker is None:
+            return
+        for job_id in {self.selection_job_id, self.preview_job_id} - {None}:
+            self.swap_worker.cancel(job_id)
+        self.selection_job_id = None
 
-        # Escalamos el pixmap al ancho disponible, manteniendo proporción
-        scaled_pixmap = pixmap.scaled(
-            available_w,
-            available_h,
-            Qt.KeepAspectRatio,
-            Qt.SmoothTransformation
-        )
+    def on_swap_preview(self, job_id, img, seconds):
+        """Muestra la vista previa reducida mientras se calcula el resultado a resolución completa."""
+        self.preview_job_id = job_id
+        self.result_frame.setImage(bgr_to_qimage(img))
+        self.result_frame.setInfo(f"Vista previa ({seconds:.1f} s) · calculando a resolución completa...")
+        self.save_btn.setEnabled(False)
+
+    def on_swap_progress(self, job_id, percent, label):
+        self.progress_bar.setValue(percent)
+        self.progress_bar.setFormat(f"{label} ({percent}%)")
+
+    def on_queue_changed(self, pending):
+        self.cancel_btn.setEnabled(pending > 0)
+        if pending > 1:
+            self.status_label.setText(f"{pending} swaps en cola")
+        elif pending == 0:
+            self.progress_bar.setFormat("%p%")
+            QTimer.singleShot(500, lambda: self.progress_bar.setVisible(self.swap_worker.pending() > 0))
+
+    def on_swap_finished(self, job_id, output_path, img):
+        self.preview_job_id = None
+        if job_id == self.selection_job_id:
+            self.selection_job_id = None
+        self.result_img = img
+        self.result_path = output_path
+        self.show_result(img)
+        self.status_label.setText(f"Resultado guardado en {output_path}")
+        if self.swap_worker.pending() <= 1:
+            QMessageBox.information(self, "Éxito", "¡Face swap completado correctamente!")
 
-        # Pintamos y actualizamos
-        self.result_frame.setImage(scaled_pixmap)
+    def on_swap_failed(self, job_id, message):
+        self.discard_preview(job_id)
+        self.status_label.setText("Error en el face swap")
+        QMessageBox.critical(self, "Error", message)
+
+    def on_swap_cancelled(self, job_id):
+        self.discard_preview(job_id)
+        self.status_label.setText("Face swap cancelado")
+
+    def discard_preview(self, job_id):
+        """Si se estaba mostrando la vista previa de este trabajo, vuelve al último resultado completo."""
+        if job_id == self.selection_job_id:
+            self.selection_job_id = None
+        if job_id != self.preview_job_id:
+            return
+        self.preview_job_id = None
+        if self.result_img is not None:
+            self.show_result(self.result_img)
+        else:
+            self.result_frame.clear()
+
+    def on_job_stats(self, job_id, stats):
+        """Muestra el desglose por etapas del último trabajo en el área de estado."""
+        etapas = " · ".join(f"{stage} {ms:.0f} ms" for stage, ms in stats['stages_ms'].items())
+        attrs = stats['attrs']
+        detalle = f"{attrs['width']}x{attrs['height']}, {attrs.get('faces', 0)} caras" if 'width' in attrs else ""
+        if attrs.get('result_cache') == 'hit':
+            detalle = f"{attrs['width']}x{attrs['height']}, desde caché"
+        texto = f"Último trabajo: {stats['duration_ms']:.0f} ms ({detalle}) | {etapas}"
+        cache = self.swapper.result_cache
+        if cache is not None:
+            texto += f" | Caché de resultados: {cache.hits} aciertos, {cache.misses} fallos"
+        self.stats_label.setText(texto)
+    
+    def show_result(self, img):
+        """
+        Muestra el resultado a resolución completa en el visor con zoom: se ajusta al espacio disponible
+        y al acercarse se ven los píxeles originales, no una ampliación de la vista reducida.
+        """
+        # El QImage envuelve el array sin copiarlo; el visor construye su pirámide de niveles a partir de él
+        self.result_frame.setImage(bgr_to_qimage(img))
         self.result_frame.setInfo("¡Face swap completado! (Ctrl + rueda para zoom)")
 
-        # Restauramos controles y barra de progreso
-        self.progress_bar.setValue(100)
-        QTimer.singleShot(500, lambda: self.progress_bar.setVisible(False))
-        for btn in (self.target_btn, self.source_btn, self.swap_btn, self.save_btn, self.reset_zoom_btn):
+        for btn in (self.save_btn, self.reset_zoom_btn):
             btn.setEnabled(True)
-        QMessageBox.information(self, "Éxito", "¡Face swap completado correctamente!")
 
     def reset_result_zoom(self):
         """Resetea el zoom de la imagen de resultado."""
@@ -453,7 +530,12 @@ class MainWindow(QMainWindow):
         """Limpia todas las imágenes y restablece el estado"""
         self.target_img_path = None
         self.source_img_path = None
+        self.target_img = None
+        self.source_img = None
         self.result_img = None
+        self.result_path = None
+        self.cancel_refinement()
+        self.preview_job_id = None
         
         # Limpiar frames
         self.target_frame.clear()
@@ -478,11 +560,41 @@ class MainWindow(QMainWindow):
         
         if path:
             try:
-                cv2.imwrite(path, self.result_img)
+                self.write_result(path)
                 QMessageBox.information(self, "Éxito", f"Imagen guardada en {path}")
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"Error al guardar la imagen: {str(e)}")
 
+    def write_result(self, path):
+        """
+        Si el resultado ya se escribió en images/generated con el mismo formato, copia esos bytes en
+        lugar de volver a codificar la imagen; si no, lo codifica con el formato de `path`. Solo se
+        reutilizan con extensiones conocidas (.jpeg equivale a .jpg): un .tif se codifica como TIFF.
+        """
+        from core.output_writer import FORMATS, atomic_write
+        writer = self.swapper.output_writer
+        saved_ext = os.path.splitext(self.result_path or '')[1].lower().lstrip('.')
+        ext = os.path.splitext(path)[1].lower().lstrip('.')
+        if self.result_path and saved_ext in FORMATS and FORMATS[saved_ext] == FORMATS.get(ext):
+            writer.wait(self.result_path)
+            if os.path.exists(self.result_path):
+                with open(self.result_path, 'rb') as f:
+                    atomic_write(path, f.read())
+                return
+        writer.save(self.result_img, path)
+
+    def closeEvent(self, event):
+        """Cancela los swaps pendientes y espera a los hilos de trabajo antes de cerrar."""
+        if self.gallery_scanner is not None:
+            self.gallery_scanner.cancel.set()
+            self.gallery_scanner.wait()
+        if self.swap_worker is not None:
+            self.swap_worker.stop()
+            self.swap_worker.wait()
+        if self.swapper is not None:
+            self.swapper.output_writer.close()
+        super().closeEvent(event)
+
 if __name__ == "__main__":
     import sys
     from PyQt5.QtWidgets import QApplication
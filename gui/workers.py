@@ -0,0 +1,257 @@
+import itertools
+import os
+import queue
+import threading
+import time
+from PyQt5.QtCore import QThread, pyqtSignal
+
+RESULT_CACHE_DIR = os.path.join("images", "result_cache")
+
+
+class ModelLoader(QThread):
+    """
+    Hilo que importa insightface/onnxruntime, carga los modelos y los calienta sin bloquear la ventana.
+    loaded se emite con el swapper ya calentado, así el primer swap del usuario no espera a ONNX Runtime.
+    """
+    loaded = pyqtSignal(object, float, dict)
+    failed = pyqtSignal(str)
+
+    def __init__(self, swapper_kwargs=None, parent=None):
+        super().__init__(parent)
+        self.swapper_kwargs = swapper_kwargs or {}
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            from core.face_cache import FaceCache
+            from core.face_swapper import FaceSwapper
+            from core.output_writer import OutputWriter
+            from core.result_cache import ResultCache
+            # Un hilo de escritura: el resultado se muestra sin esperar a que se codifique y guarde
+            kwargs = {'face_cache': FaceCache(), 'output_writer': OutputWriter(workers=1),
+                      'result_cache': ResultCache(RESULT_CACHE_DIR), **self.swapper_kwargs}
+            swapper = FaceSwapper(**kwargs)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        # Ejecutar cada sesión con sus formas (lotes de 1 y del máximo) antes de habilitar el swap: el primero no paga la
+        # reserva de memoria ni la especialización de kernels. Un fallo aquí no impide usar los modelos.
+        try:
+            from core.warmup import warm_up
+            report = warm_up(swapper)
+        except Exception as e:
+            report = {'error': str(e)}
+        self.loaded.emit(swapper, time.perf_counter() - start, report)
+
+
+STAGE_LABELS = {
+    'load': "Cargando imagen objetivo",
+    'detect_target': "Detectando caras en la imagen objetivo",
+    'detect_source': "Detectando cara fuente",
+    'swap': "Intercambiando cara {done} de {total}",
+    'encode': "Codificando resultado",
+    'write': "Guardando resultado",
+    'done': "Completado",
+}
+
+
+class StageTimings:
+    """
+    Duración medida de cada etapa del swap (media móvil exponencial entre trabajos).
+    Permite traducir la etapa actual a un porcentaje proporcional al tiempo real de cada etapa.
+    La etapa 'swap' se mide por cara.
+    """
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.seconds = {'load': 0.05, 'detect_target': 0.4, 'detect_source': 0.4,
+                        'swap': 0.25, 'encode': 0.15, 'write': 0.02}
+        self.faces = 1
+
+    def update(self, stage, seconds):
+        self.seconds[stage] = (1 - self.alpha) * self.seconds[stage] + self.alpha * seconds
+
+    def percent(self, stage, done, faces):
+        """Porcentaje completado al empezar `stage` (con `done` caras ya intercambiadas)."""
+        cost = {name: value * (faces if name == 'swap' else 1) for name, value in self.seconds.items()}
+        total = sum(cost.values())
+        if stage == 'done':
+            return 100
+        completed = 0.0
+        for name in self.seconds:
+            if name == stage:
+                break
+            completed += cost[name]
+        if stage == 'swap':
+            completed += self.seconds['swap'] * done
+        return int(100 * completed / total)
+
+
+# Lado mayor de la vista previa rápida que se muestra antes del resultado a resolución completa
+PREVIEW_SIDE = 640
+
+
+class _SwapJob:
+    def __init__(self, job_id, target, source, output, target_name=None, source_name=None, preview=False):
+        self.job_id = job_id
+        self.target = target
+        self.source = source
+        self.output = output
+        self.target_name = target_name
+        self.source_name = source_name
+        self.preview = preview
+        self.cancel = threading.Event()
+
+
+class SwapWorker(QThread):
+    """
+    Hilo que ejecuta los swaps en cola, fuera del bucle de eventos de Qt.
+    Emite el progreso por etapas medido con StageTimings y permite cancelar el trabajo en curso
+    y los pendientes. Los trabajos con vista previa emiten primero un swap sobre una copia reducida
+    del objetivo (preview_ready) y después el resultado completo.
+    """
+    progress = pyqtSignal(int, int, str)
+    preview_ready = pyqtSignal(int, object, float)
+    finished_job = pyqtSignal(int, str, object)
+    failed = pyqtSignal(int, str)
+    cancelled = pyqtSignal(int)
+    queue_changed = pyqtSignal(int)
+    job_stats = pyqtSignal(int, object)
+
+    def __init__(self, swapper, parent=None):
+        super().__init__(parent)
+        self.swapper = swapper
+        self.timings = StageTimings()
+        self._queue = queue.Queue()
+        self._jobs = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def enqueue(self, target, source, output, target_name=None, source_name=None, preview=False):
+        """
+        target y source pueden ser rutas o arrays BGR ya decodificados por la interfaz (no se modifican);
+        target_name y source_name son sus rutas de origen. Con preview se emite antes una vista previa.
+        """
+        job = _SwapJob(next(self._ids), target, source, output, target_name, source_name, preview)
+        with self._lock:
+            self._jobs.append(job)
+            pending = len(self._jobs)
+        self._queue.put(job)
+        self.queue_changed.emit(pending)
+        return job.job_id
+
+    def pending(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def cancel_all(self):
+        with self._lock:
+            for job in self._jobs:
+                job.cancel.set()
+
+    def cancel(self, job_id):
+        """Cancela un trabajo concreto (en curso o en cola); los demás siguen su curso."""
+        with self._lock:
+            for job in self._jobs:
+                if job.job_id == job_id:
+                    job.cancel.set()
+
+    def stop(self):
+        self.cancel_all()
+        self._queue.put(None)
+
+    def run(self):
+        from core.face_swapper import SwapCancelled
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            # Registro de instrumentación anterior: solo se publica el que cree swap_faces para este trabajo
+            previous_record = self.swapper.instrumentation.last
+            try:
+                if job.cancel.is_set():
+                    raise SwapCancelled()
+                if job.preview:
+                    self._preview(job)
+                _, result = self.swapper.swap_faces(job.target, job.source, job.output,
+                                                    progress=self._progress_callback(job), cancel=job.cancel,
+                                                    target_name=job.target_name, source_name=job.source_name)
+            except SwapCancelled:
+                self.cancelled.emit(job.job_id)
+            except Exception as e:
+                self.failed.emit(job.job_id, str(e))
+            else:
+                self.finished_job.emit(job.job_id, job.output, result)
+            finally:
+                record = self.swapper.instrumentation.last
+                if record is not None and record is not previous_record:
+                    self.job_stats.emit(job.job_id, record.to_dict())
+                with self._lock:
+                    self._jobs.remove(job)
+                    pending = len(self._jobs)
+                self.queue_changed.emit(pending)
+
+    def _preview(self, job):
+        """
+        Emite la vista previa reducida del trabajo. No se genera si el resultado ya está en la caché de
+        resultados (llegará enseguida sin inferencia) ni si la imagen no es mayor que la vista previa.
+        """
+        from core.face_swapper import SwapCancelled
+        if self.swapper.is_cached(job.target, job.source, job.output, job.target_name, job.source_name):
+            return
+        self.progress.emit(job.job_id, 0, "Generando vista previa")
+        start = time.perf_counter()
+        small = self.swapper.preview_swap(job.target, job.source, max_side=PREVIEW_SIDE,
+                                          target_name=job.target_name, source_name=job.source_name)
+        if job.cancel.is_set():
+            raise SwapCancelled()
+        if small is not None:
+            self.preview_ready.emit(job.job_id, small, time.perf_counter() - start)
+
+    def _progress_callback(self, job):
+        timings = self.timings
+        state = {'stage': None, 'since': time.perf_counter()}
+
+        def callback(stage, done, total):
+            now = time.perf_counter()
+            previous = state['stage']
+            if previous is not None:
+                timings.update(previous, now - state['since'])
+            if stage == 'swap':
+                timings.faces = total
+            state['stage'], state['since'] = stage, now
+            label = STAGE_LABELS.get(stage, stage).format(done=done + 1, total=total)
+            self.progress.emit(job.job_id, timings.percent(stage, done, timings.faces), label)
+
+        return callback
+
+
+class GalleryScanner(QThread):
+    """
+    Escanea la galería en segundo plano: actualiza miniaturas de archivos nuevos o modificados y,
+    si se le pasa el swapper, detecta y guarda sus caras para no tener que detectarlas al hacer swap.
+    """
+    indexed = pyqtSignal(object, object)
+    progress = pyqtSignal(str)
+
+    def __init__(self, root, db_path, index=None, swapper=None, parent=None):
+        super().__init__(parent)
+        self.root = root
+        self.db_path = db_path
+        self.index = index
+        self.swapper = swapper
+        self.cancel = threading.Event()
+
+    def run(self):
+        try:
+            from core.gallery_index import GalleryIndex
+            index = self.index or GalleryIndex(self.db_path)
+            stats = index.scan(self.root, cancel=self.cancel,
+                               progress=lambda i, n: self.progress.emit(f"Indexando galería {i}/{n}"))
+            if self.swapper is not None:
+                stats['faces_indexed'] = index.index_faces(
+                    self.swapper, cancel=self.cancel,
+                    progress=lambda i, n: self.progress.emit(f"Detectando caras de la galería {i}/{n}"))
+        except Exception as e:
+            self.progress.emit(f"Error al indexar la galería: {e}")
+            return
+        self.indexed.emit(index, stats)
@@ -0,0 +1,197 @@
+import math
+from collections import OrderedDict
+
+from PyQt5.QtCore import QPointF, QRect, QRectF, Qt, QTimer
+from PyQt5.QtGui import QPainter, QPixmap, QWheelEvent
+from PyQt5.QtWidgets import QSizePolicy, QWidget
+
+TILE_SIZE = 256
+
+
+class MipmapPyramid:
+    """
+    Pirámide de resoluciones de una imagen: el nivel 0 es la imagen completa y cada nivel siguiente
+    la mitad del anterior, hasta que el lado mayor cabe en una tesela. Cada nivel se sirve en
+    teselas de TILE_SIZE convertidas a QPixmap bajo demanda y guardadas en una caché LRU.
+    """
+    def __init__(self, image, max_tiles=384):
+        self.levels = [image]
+        while max(self.levels[-1].width(), self.levels[-1].height()) > TILE_SIZE:
+            prev = self.levels[-1]
+            self.levels.append(prev.scaled(max(1, prev.width() // 2), max(1, prev.height() // 2),
+                                           Qt.IgnoreAspectRatio, Qt.SmoothTransformation))
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()
+
+    @property
+    def width(self):
+        return self.levels[0].width()
+
+    @property
+    def height(self):
+        return self.levels[0].height()
+
+    def level_for(self, scale):
+        """Nivel más pequeño cuya resolución sigue siendo >= la de pantalla para esta escala."""
+        if scale >= 1.0:
+            return 0
+        return min(len(self.levels) - 1, int(math.floor(math.log2(1.0 / scale))))
+
+    def tile(self, level, tx, ty):
+        key = (level, tx, ty)
+        pixmap = self._tiles.get(key)
+        if pixmap is not None:
+            self._tiles.move_to_end(key)
+            return pixmap
+        image = self.levels[level]
+        rect = QRect(tx * TILE_SIZE, ty * TILE_SIZE, TILE_SIZE, TILE_SIZE).intersected(image.rect())
+        pixmap = QPixmap.fromImage(image.copy(rect))
+        self._tiles[key] = pixmap
+        while len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+        return pixmap
+
+
+class ZoomableLabel(QWidget):
+    """
+    Visor con zoom (Ctrl + rueda) y desplazamiento (arrastrar) sobre la imagen a resolución completa.
+    Con zoom 1 la imagen se ajusta al espacio disponible. Solo se dibujan las teselas visibles del
+    nivel de la pirámide adecuado a la escala, con transformación rápida mientras se interactúa y
+    suavizada cuando la interacción se detiene.
+    """
+    IDLE_MS = 150
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimumSize(250, 250)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self._pyramid = None
+        self._zoom = 1.0
+        self._min_zoom = 0.2
+        self._max_zoom = 4.0
+        self._center = QPointF()
+        self._drag_active = False
+        self._last_pos = None
+        self._smooth = True
+        self._idle = QTimer(self)
+        self._idle.setSingleShot(True)
+        self._idle.timeout.connect(self._on_idle)
+
+    def setImage(self, image):
+        """Muestra una QImage (o QPixmap) a resolución completa; la QImage no debe modificarse después."""
+        if isinstance(image, QPixmap):
+            image = image.toImage()
+        self._pyramid = MipmapPyramid(image)
+        # Permitir acercarse hasta 8 píxeles de pantalla por píxel de la imagen
+        self._max_zoom = max(4.0, 8.0 / self._fit_scale())
+        self.resetZoom()
+
+    def setPixmap(self, pixmap):
+        self.setImage(pixmap)
+
+    def clear(self):
+        self._pyramid = None
+        self.update()
+
+    def resetZoom(self):
+        self._zoom = 1.0
+        if self._pyramid is not None:
+            self._center = QPointF(self._pyramid.width / 2, self._pyramid.height / 2)
+        self.update()
+
+    def _fit_scale(self):
+        if self._pyramid is None:
+            return 1.0
+        return min(max(self.width(), 1) / self._pyramid.width, max(self.height(), 1) / self._pyramid.height)
+
+    def _scale(self):
+        return self._fit_scale() * self._zoom
+
+    def _interacting(self):
+        """Dibuja con transformación rápida y programa el repintado suavizado al quedar inactivo."""
+        self._smooth = False
+        self._idle.start(self.IDLE_MS)
+        self.update()
+
+    def _on_idle(self):
+        self._smooth = True
+        self.update()
+
+    def _clamp_center(self):
+        self._center.setX(min(max(self._center.x(), 0.0), float(self._pyramid.width)))
+        self._center.setY(min(max(self._center.y(), 0.0), float(self._pyramid.height)))
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.white)
+        if self._pyramid is None:
+            return
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, self._smooth)
+        scale = self._scale()
+        level = self._pyramid.level_for(scale)
+        level_image = self._pyramid.levels[level]
+        # Relación entre píxeles del nivel y de la imagen completa
+        level_factor = level_image.width() / self._pyramid.width
+        to_screen = scale / level_factor
+        origin_x = self.width() / 2 - self._center.x() * scale
+        origin_y = self.height() / 2 - self._center.y() * scale
+        # Rectángulo visible en coordenadas del nivel
+        visible = event.rect()
+        x0 = max(0.0, (visible.left() - origin_x) / to_screen)
+        y0 = max(0.0, (visible.top() - origin_y) / to_screen)
+        x1 = min(float(level_image.width()), (visible.right() + 1 - origin_x) / to_screen)
+        y1 = min(float(level_image.height()), (visible.bottom() + 1 - origin_y) / to_screen)
+        if x1 <= x0 or y1 <= y0:
+            return
+        for ty in range(int(y0) // TILE_SIZE, int(math.ceil(y1)) // TILE_SIZE + 1):
+            for tx in range(int(x0) // TILE_SIZE, int(math.ceil(x1)) // TILE_SIZE + 1):
+                if tx * TILE_SIZE >= level_image.width() or ty * TILE_SIZE >= level_image.height():
+                    continue
+                tile = self._pyramid.tile(level, tx, ty)
+                target = QRectF(origin_x + tx * TILE_SIZE * to_screen, origin_y + ty * TILE_SIZE * to_screen,
+                                tile.width() * to_screen, tile.height() * to_screen)
+                painter.drawPixmap(target, tile, QRectF(tile.rect()))
+
+    def wheelEvent(self, event: QWheelEvent):
+        if event.modifiers() == Qt.ControlModifier and self._pyramid is not None:
+            factor = 1.25 if event.angleDelta().y() > 0 else 0.8
+            new_zoom = min(max(self._zoom * factor, self._min_zoom), self._max_zoom)
+            # Mantener el punto bajo el cursor al hacer zoom
+            cursor = QPointF(event.pos()) - QPointF(self.width() / 2, self.height() / 2)
+            old_scale = self._scale()
+            point = self._center + cursor / old_scale
+            self._zoom = new_zoom
+            self._center = point - cursor / self._scale()
+            self._clamp_center()
+            self._interacting()
+            event.accept()
+        else:
+            super().wheelEvent(event)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton and self._zoom > 1.0:
+            self._drag_active = True
+            self._last_pos = event.pos()
+            self.setCursor(Qt.ClosedHandCursor)
+        super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        if self._drag_active and self._last_pos:
+            delta = event.pos() - self._last_pos
+            self._center -= QPointF(delta) / self._scale()
+            self._clamp_center()
+            self._last_pos = event.pos()
+            self._interacting()
+        super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self._drag_active = False
+            self.setCursor(Qt.ArrowCursor)
+        super().mouseReleaseEvent(event)
+
+    def resizeEvent(self, event):
+        if self._pyramid is not None:
+            self._max_zoom = max(4.0, 8.0 / self._fit_scale())
+        self._interacting()
+        super().resizeEvent(event)